@@ -0,0 +1,185 @@
+"""
+Reproducible benchmark of the merge pipeline on synthetic green-screen clips.
+
+Runs merge_two_videos_into_one with each engine on clips from benchmarks.synthetic
+and times every stage from the spans the pipeline records. Only the local ffmpeg
+is needed, nothing is downloaded.
+
+    python -m benchmarks.pipeline                              # print the timings
+    python -m benchmarks.pipeline --save baseline.json         # record a baseline
+    python -m benchmarks.pipeline --compare baseline.json      # flag regressions (exit 1)
+    python -m benchmarks.pipeline --seconds 30 --repeat 5 --engine files
+
+The layer cache is off unless --layer-cache is given, so repeated runs measure the work.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import make_dialogue
+from merge_two_videos import index as merge_index, spans
+from merge_two_videos.index import merge_two_videos_into_one
+
+ENGINES = ("fused", "files")
+# Stages below this are mostly noise, they are reported but never flagged
+MIN_FLAGGED_SECONDS = 0.05
+
+
+def environment():
+    try:
+        ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "ffmpeg": ffmpeg,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _stage_key(engine, recorded_span):
+    # The files engine runs composite and silence once per leg
+    return f"{engine}/{recorded_span['name']}"
+
+
+def _reported(recorded_span):
+    # Parallel legs overlap, the sum of their stages is not time the merge took.
+    # The "legs" span has the wall time of both.
+    return not (merge_index.PARALLEL_LEGS and recorded_span["parent"] == "legs")
+
+
+def run_engine(engine, clips, output_path, repeat, use_layer_cache=False):
+    """
+    Merge the clips `repeat` times with one engine.
+
+    :return: dict of "engine/stage" -> list of (seconds, frames), one entry per
+        occurrence of the stage, summed within a run.
+    """
+    video_1, video_2, background_1, background_2 = clips
+    runs = []
+    for _ in range(repeat):
+        with spans.recording() as recorded:
+            merge_two_videos_into_one(str(video_1), str(video_2), str(background_1), str(background_2),
+                                      str(output_path), engine=engine, use_cache=use_layer_cache)
+        totals = {}
+        for recorded_span in filter(_reported, recorded):
+            seconds, frames = totals.get(_stage_key(engine, recorded_span), (0.0, 0))
+            totals[_stage_key(engine, recorded_span)] = (
+                seconds + recorded_span["seconds"], frames + recorded_span["frames"]
+            )
+        runs.append(totals)
+    return {key: [run[key] for run in runs if key in run] for key in runs[0]}
+
+
+def summarize(samples):
+    seconds = [sample[0] for sample in samples]
+    median = statistics.median(seconds)
+    frames = samples[0][1]
+    return {
+        "median": median,
+        "min": min(seconds),
+        "runs": seconds,
+        "frames": frames,
+        "fps": frames / median if frames and median else None,
+    }
+
+
+def benchmark(width, height, seconds, fps, repeat, engines, use_layer_cache=False):
+    results = {}
+    mask_log = merge_index.MASK_LOG
+    with tempfile.TemporaryDirectory(prefix="merge_bench_") as work_dir:
+        # The masks of synthetic clips must not end up in the repo's frames.txt,
+        # benchmarks.prune reads it as its fixtures
+        merge_index.MASK_LOG = str(Path(work_dir) / "frames.txt")
+        try:
+            clips = make_dialogue(work_dir, width, height, seconds, fps)
+            for engine in engines:
+                stages = run_engine(engine, clips, Path(work_dir) / f"merged_{engine}.mp4", repeat, use_layer_cache)
+                results.update({key: summarize(samples) for key, samples in stages.items()})
+        finally:
+            merge_index.MASK_LOG = mask_log
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the stages side by side with the baseline.
+
+    :return: The stages that got slower than baseline * (1 + tolerance).
+    """
+    regressions = []
+    print(f"{'stage':<20} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for key, current in results.items():
+        previous = baseline["stages"].get(key)
+        if previous is None:
+            print(f"{key:<20} {'-':>10} {current['median']:>9.3f}s {'new':>7}")
+            continue
+        ratio = current["median"] / previous["median"] if previous["median"] else float("inf")
+        slower = ratio > 1 + tolerance and current["median"] - previous["median"] > MIN_FLAGGED_SECONDS
+        if slower:
+            regressions.append(key)
+        print(f"{key:<20} {previous['median']:>9.3f}s {current['median']:>9.3f}s {ratio:>6.2f}x"
+              + (" ❌" if slower else ""))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':<20} {'median':>10} {'min':>10} {'fps':>8}")
+    for key, result in results.items():
+        fps = f"{result['fps']:.1f}" if result["fps"] else "-"
+        print(f"{key:<20} {result['median']:>9.3f}s {result['min']:>9.3f}s {fps:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=ENGINES, action="append", help="engines to run (default: all)")
+    parser.add_argument("--layer-cache", action="store_true", help="let the engines use the layer cache")
+    parser.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="compare against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    config = {
+        "width": args.width, "height": args.height, "seconds": args.seconds, "fps": args.fps,
+        "repeat": args.repeat, "layer_cache": args.layer_cache, "parallel_legs": merge_index.PARALLEL_LEGS,
+    }
+    results = benchmark(args.width, args.height, args.seconds, args.fps, args.repeat,
+                        args.engine or ENGINES, args.layer_cache)
+    print_results(results)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(
+            {"config": config, "environment": environment(), "stages": results}, indent=2
+        ))
+        print(f"✅ Baseline written to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline["config"] != config:
+            print(f"⚠️ Baseline was recorded with {baseline['config']}, the timings are not comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
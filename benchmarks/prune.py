@@ -0,0 +1,156 @@
+"""
+Correctness and speed harness for prune_sandwiched_zeros.
+
+    python -m benchmarks.prune                 # equivalence checks + benchmark
+    python -m benchmarks.prune --cases 5000    # more random cases
+    python -m benchmarks.prune --no-bench      # equivalence checks only
+"""
+import argparse
+import ast
+import time
+from pathlib import Path
+
+import numpy as np
+
+from merge_two_videos.index import prune_sandwiched_zeros
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+GOLDEN_FILES = [REPO_ROOT / "frames.txt", REPO_ROOT / "merge_two_videos" / "frames.txt"]
+BENCH_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def reference_prune_sandwiched_zeros(arr1, arr2, iterations=30):
+    """
+    The original per-element implementation, kept as the specification.
+    """
+    output1=[]
+    output2=[]
+    max_len = max(len(arr1), len(arr2))
+    arr1 = np.pad(arr1, (0, max_len - len(arr1)), constant_values=0)
+    arr2 = np.pad(arr2, (0, max_len - len(arr2)), constant_values=0)
+
+    arr1 = np.array(arr1, dtype=int)
+    arr2 = np.array(arr2, dtype=int)
+
+    for iteration in range(iterations):
+        current = arr1 if iteration % 2 == 0 else arr2
+        other = arr2 if iteration % 2 == 0 else arr1
+
+        for i in range(len(current)):
+            if current[i] == 0 or current[i] == -1:
+                if(i-1>0):
+                    if(current[i-1]==1 and other[i-1]==1):
+                        current[i-1]=0
+
+                if(i+1<len(current)):
+                    if(current[i+1]==1 and (i+1==len(other) or other[i+1]==1)):
+                        current[i+1]=0
+
+        if iteration % 2 == 0:
+            output1=current
+        else:
+            output2=current
+
+    return output1,output2
+
+
+def random_mask(rng, length, values=(0, 1)):
+    """
+    Masks made of runs, like real silence masks, rather than independent noise.
+    """
+    out = []
+    while len(out) < length:
+        out += [rng.choice(values)] * int(rng.geometric(rng.uniform(0.05, 0.9)))
+    return np.array(out[:length], dtype=np.uint8 if min(values) >= 0 else int)
+
+
+def golden_pairs():
+    for path in GOLDEN_FILES:
+        if not path.exists():
+            continue
+        lines = [line for line in path.read_text().splitlines() if line.strip()]
+        for first, second in zip(lines[::2], lines[1::2]):
+            yield np.array(ast.literal_eval(first)), np.array(ast.literal_eval(second))
+
+
+def same_output(expected, actual):
+    return all(
+        np.array_equal(np.asarray(e), np.asarray(a)) and len(e) == len(a)
+        for e, a in zip(expected, actual)
+    )
+
+
+def check_equivalence(cases, seed):
+    rng = np.random.default_rng(seed)
+    failures = 0
+
+    checked = 0
+    for mask_1, mask_2 in golden_pairs():
+        for masks in ((mask_1, mask_2), (1 - mask_1, mask_2), (mask_1, 1 - mask_2)):
+            if not same_output(reference_prune_sandwiched_zeros(*masks), prune_sandwiched_zeros(*masks)):
+                failures += 1
+                print("❌ golden fixture mismatch")
+            checked += 1
+    print(f"golden fixtures: {checked} checked")
+
+    for case in range(cases):
+        length_1 = int(rng.integers(0, 200))
+        length_2 = length_1 if rng.random() < 0.8 else int(rng.integers(0, 200))
+        values = (0, 1, -1) if rng.random() < 0.2 else (0, 1)
+        mask_1 = random_mask(rng, length_1, values)
+        mask_2 = random_mask(rng, length_2, values)
+        iterations = 30 if rng.random() < 0.7 else int(rng.integers(0, 40))
+
+        expected = reference_prune_sandwiched_zeros(mask_1, mask_2, iterations)
+        actual = prune_sandwiched_zeros(mask_1, mask_2, iterations)
+        if not same_output(expected, actual):
+            failures += 1
+            print(f"❌ case {case}: iterations={iterations}")
+            print("   mask_1 =", mask_1.tolist())
+            print("   mask_2 =", mask_2.tolist())
+    print(f"random cases: {cases} checked, seed {seed}")
+    return failures
+
+
+def bench(sizes, reference_max, repeat, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'frames':>10} {'vectorized':>12} {'reference':>12} {'speedup':>9}")
+    for size in sizes:
+        mask_1 = random_mask(rng, size)
+        mask_2 = random_mask(rng, size)
+
+        best = min(_timed(prune_sandwiched_zeros, mask_1, mask_2) for _ in range(repeat))
+        if size <= reference_max:
+            reference = _timed(reference_prune_sandwiched_zeros, mask_1, mask_2)
+            print(f"{size:>10} {best * 1000:>10.2f}ms {reference * 1000:>10.1f}ms {reference / best:>8.0f}x")
+        else:
+            print(f"{size:>10} {best * 1000:>10.2f}ms {'-':>12} {'-':>9}")
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=1000, help="random equivalence cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-bench", action="store_true", help="skip the micro-benchmark")
+    parser.add_argument("--reference-max", type=int, default=100_000,
+                        help="largest mask the slow reference is timed on")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = check_equivalence(args.cases, args.seed)
+    if failures:
+        raise SystemExit(f"{failures} mismatches against the reference implementation")
+    print("✅ vectorized output matches the reference")
+
+    if not args.no_bench:
+        bench(BENCH_SIZES, args.reference_max, args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Synthetic green-screen clips for the benchmarks, generated offline with numpy and
+the local ffmpeg.
+
+A clip is a flat chroma-green frame with a subject (a shaded ellipse with a
+"face") moving on a Lissajous path, and a tone that is muted during scripted
+silences, so the silence masks and the keying see something like the real input.
+
+    python -m benchmarks.synthetic out_dir [--width 640 --height 360 --seconds 10 --fps 30]
+"""
+import argparse
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from merge_two_videos.frame_sink import FrameSink
+
+GREEN_BGR = (0, 255, 0)  # inside LOWER_GREEN..UPPER_GREEN
+SAMPLE_RATE = 44100
+
+
+def alternating_silences(seconds, turn=2.0, offset=0.0):
+    """
+    Silent intervals for one speaker of a dialogue: silent every other turn of
+    `turn` seconds, starting with a silent turn at `offset`.
+    """
+    intervals = []
+    start = offset
+    while start < seconds:
+        intervals.append((start, min(start + turn, seconds)))
+        start += 2 * turn
+    return intervals
+
+
+def _subject_frame(width, height, t, color):
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = GREEN_BGR
+
+    # Lissajous path inside the middle of the frame
+    cx = int(width * (0.5 + 0.25 * np.sin(2 * np.pi * 0.23 * t)))
+    cy = int(height * (0.5 + 0.15 * np.sin(2 * np.pi * 0.31 * t + 1.0)))
+    axes = (max(width // 10, 4), max(height // 4, 4))
+    cv2.ellipse(frame, (cx, cy), axes, 0, 0, 360, color, -1)
+    cv2.circle(frame, (cx, cy - axes[1] // 2), max(axes[0] // 2, 2), (200, 180, 255), -1)
+    cv2.rectangle(frame, (cx - axes[0] // 3, cy), (cx + axes[0] // 3, cy + axes[1] // 8), (40, 40, 40), -1)
+    return frame
+
+
+def make_audio(path, seconds, silences, frequency=220):
+    """
+    Write a tone of the given length that is muted during each (start, end) interval.
+    """
+    audio_filter = f"sine=frequency={frequency}:sample_rate={SAMPLE_RATE}:duration={seconds:g}"
+    if silences:
+        enable = "+".join(f"between(t,{start:g},{end:g})" for start, end in silences)
+        audio_filter += f",volume=0:enable='{enable}'"
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", audio_filter,
+        "-ac", "2", str(path)
+    ], check=True)
+
+
+def make_clip(path, width=640, height=360, seconds=10.0, fps=30, silences=(), color=(60, 90, 200), frequency=220):
+    """
+    Write a synthetic green-screen clip with audio.
+
+    :param silences: (start, end) seconds during which the audio is silent.
+    :return: Path of the clip.
+    """
+    path = Path(path)
+    audio_path = path.with_suffix(".wav")
+    make_audio(audio_path, seconds, silences, frequency)
+    try:
+        with FrameSink(path, width, height, fps, audio_inputs=[audio_path]) as out:
+            for frame_idx in range(int(round(seconds * fps))):
+                out.write(_subject_frame(width, height, frame_idx / fps, color))
+    finally:
+        audio_path.unlink()
+    return path
+
+
+def make_background(path, width, height, seed=0):
+    """
+    Write a smooth gradient background with some noise (so it is not trivially compressible).
+    """
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 1, width, dtype=np.float32), np.linspace(0, 1, height, dtype=np.float32))
+    base = np.stack([x * 200 + y * 40, y * 180 + 30, (1 - x) * 160 + 50], axis=-1)
+    image = np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8)
+    cv2.imwrite(str(path), image)
+    return Path(path)
+
+
+def make_dialogue(out_dir, width=640, height=360, seconds=10.0, fps=30, turn=2.0):
+    """
+    Two clips that take turns talking, plus a background for each.
+
+    :return: (clip 1, clip 2, background 1, background 2)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    clip_1 = make_clip(out_dir / "speaker_1.mp4", width, height, seconds, fps,
+                       silences=alternating_silences(seconds, turn, offset=turn), frequency=220)
+    clip_2 = make_clip(out_dir / "speaker_2.mp4", width, height, seconds, fps,
+                       silences=alternating_silences(seconds, turn, offset=0.0),
+                       color=(180, 70, 70), frequency=330)
+    background_1 = make_background(out_dir / "background_1.png", width, height, seed=1)
+    background_2 = make_background(out_dir / "background_2.png", width, height, seed=2)
+    return clip_1, clip_2, background_1, background_2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--turn", type=float, default=2.0, help="seconds per speaker turn")
+    args = parser.parse_args()
+
+    for path in make_dialogue(args.out_dir, args.width, args.height, args.seconds, args.fps, args.turn):
+        print(f"✅ {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import hashlib
+
 thumbnail_list = [
     # From Image 1
     "thumbnail_gwynneth_vqa.74fc5dc4dd9034c0101e.png",
@@ -341,4 +343,7 @@ thumbnail_list = [
     "thumbnail_oscar_vqa.ee46606164112d448d93.png",
     "thumbnail_lindsay_vqa.3d397fdb533036050f2a.png",
     "thumbnail_pilo_vqa.9cae328848177abbed81.png"
-]
\ No newline at end of file
+]
+
+# Changes whenever the list does, pages rendered from the catalog are cached against it
+CATALOG_VERSION = hashlib.sha256("\n".join(thumbnail_list).encode()).hexdigest()
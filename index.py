@@ -1,33 +1,99 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from pathlib import Path
 from datetime import datetime
-from collections import deque
+from functools import lru_cache
 import json
+import mimetypes
 import os
-import io
+import time
 import uvicorn
-from characters import thumbnail_list
-from merge_two_videos.index import merge_two_videos_into_one
+from characters import thumbnail_list, CATALOG_VERSION
+from merge_jobs import submit_merge, get_job, list_jobs
+from merge_two_videos.backgrounds import prepare_backgrounds
+from merge_two_videos.edl import validate_edl, check_edl_sources
+from upload_store import store_upload, UploadTooLarge, UploadNotFound, UploadIncomplete, InvalidUpload, TooManyUploads
+import upload_store
+import media_index
+import page_cache
+import thumbnails
+import order_queue
+import metrics
+from merge_two_videos import job_store
+import merge_jobs
 import random
 import string
-from PIL import Image
 app = FastAPI()
 
 UPLOAD_DIR = "./uploads"
 TEMP_DIR = "temp_backgrounds"
 MERGE_DIR = "merged"
+PAIRS_PER_PAGE = 50
+MERGED_PER_PAGE = 24
+ORDER_STREAM_KEEPALIVE = 15
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Serve uploaded files as static files (for video streaming)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 app.mount("/temp_backgrounds", StaticFiles(directory=TEMP_DIR), name="temp_backgrounds")
 app.mount("/merged", StaticFiles(directory=MERGE_DIR), name="merged")
-# Global queue to hold orders
-order_queue = deque()
+
+# === Metrics (see /metrics) ===
+UPLOAD_THROUGHPUT = metrics.Histogram(
+    "upload_throughput_bytes_per_second", "Rate at which upload requests were stored.",
+    metrics.THROUGHPUT_BUCKETS, ("endpoint",)
+)
+UPLOAD_BYTES = metrics.Counter("upload_bytes_total", "Bytes stored by the upload endpoints.")
+NEXT_ORDER_SECONDS = metrics.Histogram(
+    "next_order_seconds", "Time to answer /next-order, long-poll waiting included.", label_names=("result",)
+)
+
+
+def _record_upload(endpoint, size, started):
+    elapsed = time.perf_counter() - started
+    UPLOAD_BYTES.inc(size)
+    if size and elapsed > 0:
+        UPLOAD_THROUGHPUT.observe(size / elapsed, endpoint=endpoint)
+
+
+def _collect_queue_depth():
+    lines = metrics.header_lines("merge_jobs", "Merge jobs in the job store by status.", "gauge")
+    lines += [f'merge_jobs{{status="{status}"}} {count}' for status, count in job_store.counts().items()]
+    lines += metrics.header_lines("orders", "Orders in the order queue by status.", "gauge")
+    lines += [f'orders{{status="{status}"}} {count}' for status, count in order_queue.stats().items()]
+    return lines
+
+
+def _collect_merge_histograms():
+    histograms = job_store.histograms(metrics.MERGE_BUCKETS)
+    series = (
+        ("merge_job_latency_seconds", "Merge jobs from submission to completion.", "latency", "status"),
+        ("merge_job_render_seconds", "Merge jobs from claim to completion (done jobs).", "render", None),
+        ("merge_stage_seconds", "Time spent in each stage of the merge pipeline.", "stage", "stage"),
+    )
+    lines = []
+    for name, help_text, key, label in series:
+        lines += metrics.header_lines(name, help_text, "histogram")
+        for label_value, (bucket_counts, total, count) in sorted(histograms[key].items(), key=lambda item: str(item[0])):
+            labels = {label: label_value} if label else None
+            lines += metrics.histogram_lines(name, metrics.MERGE_BUCKETS, bucket_counts, total, count, labels)
+    return lines
+
+
+metrics.Collector(_collect_queue_depth)
+metrics.Collector(_collect_merge_histograms)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 name = "index"
 index = 0
@@ -36,40 +102,142 @@ async def upload_file(file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".mp4"):
         raise HTTPException(status_code=400, detail="Only MP4 files are allowed.")
 
-    contents = await file.read()
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    filename = os.path.basename(file.filename)
+    started = time.perf_counter()
+    try:
+        stored = await store_upload(file, filename, UPLOAD_DIR)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    _record_upload("upload", stored["size"], started)
+    # Probes the video and writes the index, both blocking
+    await run_in_threadpool(media_index.add_media, media_index.UPLOAD, os.path.join(UPLOAD_DIR, filename),
+                            sha256=stored["sha256"])
+    print(f"File {filename} uploaded successfully to {os.path.join(UPLOAD_DIR, filename)}")
+
+    return {"status": "received", **stored}
+
+
+# === Resumable chunked uploads ===
+# Create a session, PUT chunks (in any order, in parallel) with ?offset=, ask for the
+# received offset/ranges to resume, then finalize to publish it like POST /upload.
+
+@app.post("/resumable-uploads")
+async def create_resumable_upload(filename: str = Form(...), size: str = Form(...)):
+    if not filename.lower().endswith(".mp4"):
+        raise HTTPException(status_code=400, detail="Only MP4 files are allowed.")
+    try:
+        # Sweeps expired sessions off the disk first
+        return await run_in_threadpool(upload_store.create_session, os.path.basename(filename), size)
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TooManyUploads as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@app.put("/resumable-uploads/{upload_id}")
+async def append_resumable_chunk(upload_id: str, offset: int, request: Request):
+    started = time.perf_counter()
+    received = 0
+
+    async def counted(chunks):
+        nonlocal received
+        async for chunk in chunks:
+            received += len(chunk)
+            yield chunk
+
+    try:
+        return await upload_store.write_chunk(upload_id, offset, counted(request.stream()))
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=416, detail=str(e))
+    finally:
+        _record_upload("resumable", received, started)
+
+
+@app.get("/resumable-uploads/{upload_id}")
+async def resumable_upload_status(upload_id: str):
+    try:
+        return upload_store.session_status(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-   
-    with open(file_path, "wb") as f:
-        f.write(contents)
-    print(f"File {file.filename} uploaded successfully to {file_path}")
-    index_uploads +=1 
 
-    return {"status": "received", "filename": file.filename}
+@app.post("/resumable-uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, sha256: str = Form(None)):
+    try:
+        # Hashes the whole upload, which would stall every other request on the event loop
+        stored = await run_in_threadpool(upload_store.finalize_session, UPLOAD_DIR, upload_id, expected_sha256=sha256)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadIncomplete as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await run_in_threadpool(media_index.add_media, media_index.UPLOAD, os.path.join(UPLOAD_DIR, stored["filename"]),
+                            sha256=stored["sha256"])
+    print(f"File {stored['filename']} uploaded successfully to {os.path.join(UPLOAD_DIR, stored['filename'])}")
+    return {"status": "received", **stored}
+
+
+def _page_links(path, page, page_count, **params):
+    """
+    Previous/next links for a paginated page.
+    """
+    if page_count <= 1:
+        return ""
+    query = "".join(f"&{key}={value}" for key, value in params.items())
+    links = []
+    if page > 0:
+        links.append(f'<a href="{path}?page={page - 1}{query}">&laquo; Previous</a>')
+    links.append(f"Page {page + 1} of {page_count}")
+    if page < page_count - 1:
+        links.append(f'<a href="{path}?page={page + 1}{query}">Next &raquo;</a>')
+    return "<p>" + " | ".join(links) + "</p>\n"
+
+
+def _query_int(request, name, default=0):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
 
 
 @app.get("/videos", response_class=HTMLResponse)
 async def list_videos(request: Request):
-    files = sorted(
-        [f for f in Path(UPLOAD_DIR).glob("*.mp4") if f.is_file()],
-        key=lambda f: f.stat().st_ctime
+    pair_index = _query_int(request, "pair")
+    page = _query_int(request, "page", None)
+    return page_cache.cached_html(
+        request, ("videos", pair_index, page), media_index.generation(),
+        lambda: _render_videos_page(pair_index, page)
     )
 
-    # Group videos into pairs
-    pairs = [files[i:i + 2] for i in range(0, len(files) - len(files) % 2, 2)]
-    odd_video = files[-1] if len(files) % 2 == 1 else None
 
-    pair_index = int(request.query_params.get("pair", "0"))
-    if pair_index < 0 or pair_index >= len(pairs):
-        pair_index = 0
-    selected_pair = pairs[pair_index] if pairs else []
+def _render_videos_page(pair_index, page):
+    upload_count = media_index.count(media_index.UPLOAD)
 
-    # Dropdown to select pair
+    # Group videos into pairs (in upload order)
+    pair_count = upload_count // 2
+    odd_video = media_index.list_media(media_index.UPLOAD, offset=upload_count - 1, limit=1)[0] \
+        if upload_count % 2 == 1 else None
+
+    if pair_index < 0 or pair_index >= pair_count:
+        pair_index = 0
+    selected_pair = media_index.upload_pair(pair_index) if pair_count else []
+
+    # Dropdown to select a pair on the current page of pairs
+    page_count = max((pair_count + PAIRS_PER_PAGE - 1) // PAIRS_PER_PAGE, 1)
+    if page is None:
+        page = pair_index // PAIRS_PER_PAGE
+    if page < 0 or page >= page_count:
+        page = 0
+    first_pair = page * PAIRS_PER_PAGE
     select_html = '<form method="get" action="/videos">\n<select name="pair" onchange="this.form.submit()">\n'
-    for i in range(len(pairs)):
+    for i in range(first_pair, min(first_pair + PAIRS_PER_PAGE, pair_count)):
         selected_attr = "selected" if i == pair_index else ""
         select_html += f'<option value="{i}" {selected_attr}>Pair {i + 1}</option>\n'
     select_html += "</select>\n</form>\n"
+    select_html += _page_links("/videos", page, page_count)
 
     # Video display and upload form
     video_items = ""
@@ -78,8 +246,8 @@ async def list_videos(request: Request):
     if selected_pair:
         merge_form = f"""
         <form method="post" action="/merge" enctype="multipart/form-data">
-            <input type="hidden" name="video1" value="{selected_pair[0].name}">
-            <input type="hidden" name="video2" value="{selected_pair[1].name}">
+            <input type="hidden" name="video1" value="{selected_pair[0]['name']}">
+            <input type="hidden" name="video2" value="{selected_pair[1]['name']}">
 
             <label for="bg1">Select Background 1 (upload):</label>
             <input type="file" name="bg1" accept="image/*" required><br><br>
@@ -91,25 +259,25 @@ async def list_videos(request: Request):
         </form>
         """
 
-        for file in selected_pair:
-            created_at = datetime.fromtimestamp(file.stat().st_ctime).strftime('%Y-%m-%d %H:%M:%S')
+        for video in selected_pair:
+            created_at = datetime.fromtimestamp(video["ctime"]).strftime('%Y-%m-%d %H:%M:%S')
             video_items += f"""
                 <div style="margin-bottom: 20px;">
-                    <h3>{file.name} — {created_at}</h3>
+                    <h3>{video['name']} — {created_at}</h3>
                     <video width="480" controls>
-                        <source src="/uploads/{file.name}" type="video/mp4">
+                        <source src="/uploads/{video['name']}" type="video/mp4">
                         Your browser does not support the video tag.
                     </video>
                 </div>
             """
 
-    if not pairs and odd_video:
-        created_at = datetime.fromtimestamp(odd_video.stat().st_ctime).strftime('%Y-%m-%d %H:%M:%S')
+    if not pair_count and odd_video:
+        created_at = datetime.fromtimestamp(odd_video["ctime"]).strftime('%Y-%m-%d %H:%M:%S')
         video_items += f"""
             <div style="margin-bottom: 20px;">
-                <h3>{odd_video.name} — {created_at}</h3>
+                <h3>{odd_video['name']} — {created_at}</h3>
                 <video width="480" controls>
-                    <source src="/uploads/{odd_video.name}" type="video/mp4">
+                    <source src="/uploads/{odd_video['name']}" type="video/mp4">
                     Your browser does not support the video tag.
                 </video>
             </div>
@@ -128,7 +296,7 @@ async def list_videos(request: Request):
     </body>
     </html>
     """
-    return HTMLResponse(content=html)
+    return html
 
 
 @app.post("/merge")
@@ -140,70 +308,149 @@ async def merge_videos(
 ):
     bg1_bytes = await bg1.read()
     bg2_bytes = await bg2.read()
-    img1 = Image.open(io.BytesIO(bg1_bytes)).convert("RGB")
-    img2 = Image.open(io.BytesIO(bg2_bytes)).convert("RGB")
-
-    # Determine target (smaller) size
-    width1, height1 = img1.size
-    width2, height2 = img2.size
-    target_width = min(width1, width2)
-    target_height = min(height1, height2)
-
-    def center_crop(image, target_w, target_h):
-        w, h = image.size
-        left = (w - target_w) // 2
-        upper = (h - target_h) // 2
-        right = left + target_w
-        lower = upper + target_h
-        return image.crop((left, upper, right, lower))
-
-    # Crop both images (if needed)
-    img1_cropped = center_crop(img1, target_width, target_height)
-    img2_cropped = center_crop(img2, target_width, target_height)
-
-    # Save cropped images
-    bg1_path = Path(TEMP_DIR) / f"bg1_{bg1.filename}"
-    bg2_path = Path(TEMP_DIR) / f"bg2_{bg2.filename}"
-    img1_cropped.save(bg1_path)
-    img2_cropped.save(bg2_path)
+
+    # Center-cropped to the common size and cached by content, workers read the cached files.
+    # Decoding and re-encoding the images blocks, so it runs off the event loop
+    (_, bg1_path), (_, bg2_path) = await run_in_threadpool(prepare_backgrounds, bg1_bytes, bg2_bytes)
     video1_path = Path(UPLOAD_DIR)/video1
     video2_path = Path(UPLOAD_DIR)/video2
     random_digits = ''.join(random.choices(string.digits, k=10))+".mp4"
     merge_path =Path(MERGE_DIR)/ random_digits
-    merge_two_videos_into_one(video1_path,video2_path,bg1_path,bg2_path,merge_path)
-    # Merge logic placeholder — here you’d invoke your video processing code
+    job_id = submit_merge(video1_path,video2_path,bg1_path,bg2_path,merge_path)
     return {
+        "job_id": job_id,
         "video1": video1,
         "video2": video2,
         "background1_saved": str(bg1_path),
         "background2_saved": str(bg2_path),
-        "status": "Merge request received"
+        "output": str(merge_path),
+        "status": "Merge request queued"
     }
 
+
+@app.get("/jobs")
+async def jobs_list():
+    return {"jobs": list_jobs()}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@app.post("/jobs/{job_id}/rerender")
+async def rerender_job(job_id: str, edl_json: str = Form(None)):
+    """
+    Render the inputs of a job again, with its edit decision list or an edited one.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if edl_json:
+        try:
+            edl = check_edl_sources(validate_edl(json.loads(edl_json)), job["video1"], job["video2"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid EDL: {e}")
+    elif job["edl"] is not None:
+        edl = job["edl"]
+    else:
+        raise HTTPException(status_code=409, detail="The job has no EDL yet, pass one in edl_json.")
+
+    random_digits = ''.join(random.choices(string.digits, k=10))+".mp4"
+    merge_path = Path(MERGE_DIR)/random_digits
+    new_job_id = submit_merge(job["video1"], job["video2"], job["background1"], job["background2"], merge_path, edl)
+    return {
+        "job_id": new_job_id,
+        "rerender_of": job_id,
+        "output": str(merge_path),
+        "status": "Merge request queued"
+    }
+
+
+@app.on_event("startup")
+def reconcile_media_index():
+    upload_store.move_legacy_store(UPLOAD_DIR)
+    upload_store.sweep_sessions()
+    media_index.reconcile(media_index.UPLOAD, UPLOAD_DIR)
+    media_index.reconcile(media_index.MERGED, MERGE_DIR)
+
+
+@app.on_event("startup")
+def build_thumbnails():
+    thumbnails.load_manifest()
+
+
+@app.on_event("startup")
+def start_merge_workers():
+    merge_jobs.start_workers()
+
+
+@app.on_event("shutdown")
+def stop_merge_workers():
+    merge_jobs.shutdown()
+
 from fastapi.staticfiles import StaticFiles
 
 app.mount("/thumbnails", StaticFiles(directory="extracted_sprites_contour"), name="thumbnails")
 
 
-@app.get("/add-order", response_class=HTMLResponse)
-async def add_order_form():
-    local_base_url = "/thumbnails/"
-    options_html1 = "".join([
-        f'''
-        <div class="option" onclick="selectThumbnail1('{"tile_" + str(index) + ".png"}')">
-            <img src="{local_base_url}{"tile_" + str(index)  + ".png"}" alt="{name}" />
-        </div>
-        ''' for index, name in enumerate(thumbnail_list)
-    ])
-    options_html2 = "".join([
+@app.get("/thumbnail-variants/{name}")
+async def thumbnail_variant(name: str):
+    path = thumbnails.variant_path(name)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Names carry a hash of the content, a URL never changes what it points to
+    return FileResponse(
+        path,
+        media_type=thumbnails.MEDIA_TYPES[path.suffix[1:]],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
+def _thumbnail_html(tile, alt):
+    variants = thumbnails.variants(tile)
+    if variants is None:
+        return f'<img src="/thumbnails/{tile}" alt="{alt}" loading="lazy" />'
+
+    def srcset(fmt):
+        return ", ".join(f"/thumbnail-variants/{name} {width}w" for width, name in sorted(variants[fmt].items()))
+
+    smallest = min(variants["png"])
+    return f'''<picture>
+                <source type="image/webp" srcset="{srcset("webp")}" sizes="150px">
+                <img src="/thumbnail-variants/{variants["png"][smallest]}" srcset="{srcset("png")}" sizes="150px"
+                     width="150" height="150" alt="{alt}" loading="lazy" decoding="async" />
+            </picture>'''
+
+
+@lru_cache(maxsize=None)
+def _character_options(dropdown, manifest_version):
+    """
+    Options of a character dropdown, rendered once per catalog and thumbnail build.
+    """
+    return "".join([
         f'''
-        <div class="option" onclick="selectThumbnail2('{"tile_" + str(index) + ".png"}')">
-            <img src="{local_base_url}{"tile_" + str(index)  + ".png"}" alt="{name}" />
+        <div class="option" onclick="selectThumbnail{dropdown}('{"tile_" + str(index) + ".png"}')">
+            {_thumbnail_html("tile_" + str(index) + ".png", name)}
         </div>
         ''' for index, name in enumerate(thumbnail_list)
     ])
 
-    return HTMLResponse(f"""
+
+@app.get("/add-order", response_class=HTMLResponse)
+async def add_order_form(request: Request):
+    version = (CATALOG_VERSION, thumbnails.manifest_version())
+    return page_cache.cached_html(request, ("add-order",), version, lambda: _render_add_order_form(version[1]))
+
+
+def _render_add_order_form(manifest_version):
+    options_html1 = _character_options(1, manifest_version)
+    options_html2 = _character_options(2, manifest_version)
+
+    return f"""
     <html>
     <head>
         <title>Add Order</title>
@@ -298,7 +545,7 @@ async def add_order_form():
         </form>
     </body>
     </html>
-    """)
+    """
 
 @app.post("/add-order", response_class=HTMLResponse)
 async def add_order(selected_character1:str=Form(...),selected_character2:str=Form(...), order_name: str = Form(...), order_json: str = Form(...)):
@@ -308,7 +555,8 @@ async def add_order(selected_character1:str=Form(...),selected_character2:str=Fo
         if not isinstance(order, list) or not all(isinstance(item, str) for item in order):
             raise ValueError("Invalid format: must be a list of strings.")
 
-        order_queue.append({
+        # Waits for SQLite's write lock under contention, off the event loop
+        await run_in_threadpool(order_queue.enqueue, {
             "name": order_name,
             "order": order,
             "character1": selected_character1,
@@ -333,39 +581,137 @@ async def add_order(selected_character1:str=Form(...),selected_character2:str=Fo
             </html>
         """)
 @app.get("/next-order")
-async def get_next_order():
-    if not order_queue:
+async def get_next_order(wait: float = 0):
+    started = time.perf_counter()
+    # With ?wait=, block up to that many seconds for an order instead of returning empty
+    next_order = await order_queue.wait_for(order_queue.pop, wait)  # Remove and return the first item
+    NEXT_ORDER_SECONDS.observe(time.perf_counter() - started, result="order" if next_order else "empty")
+    if next_order is None:
         return {"message": "Queue is empty"}
-    next_order = order_queue.popleft()  # Remove and return the first item
-    name = next_order["name"]
     return {"next_order": next_order}
 
+
+# === Leased consumption ===
+#
+# Consumers claim up to n orders at once, each leased for lease_seconds, and ack or
+# fail every one of them. Orders whose lease runs out are handed out again.
+
+@app.post("/orders/claim")
+async def claim_orders(n: int = 1, lease_seconds: float = order_queue.ORDER_LEASE_SECONDS, wait: float = 0):
+    if n < 1 or lease_seconds <= 0:
+        raise HTTPException(status_code=400, detail="n and lease_seconds must be positive")
+    orders = await order_queue.wait_for(lambda: order_queue.claim(n, lease_seconds), wait)
+    return {"orders": orders}
+
+
+@app.get("/next-order/stream")
+async def stream_orders(request: Request, lease_seconds: float = None):
+    """
+    Server-sent events: every order is pushed to exactly one subscribed consumer as
+    soon as it is enqueued. Orders are popped like /next-order, or leased (and must
+    be acked) when lease_seconds is given.
+    """
+    if lease_seconds is not None and lease_seconds <= 0:
+        raise HTTPException(status_code=400, detail="lease_seconds must be positive")
+
+    def take():
+        if lease_seconds is None:
+            order = order_queue.pop()
+            return [order] if order else []
+        return order_queue.claim(1, lease_seconds)
+
+    async def events():
+        yield "retry: 1000\n\n"
+        while True:
+            orders = await order_queue.wait_for(take, ORDER_STREAM_KEEPALIVE, request.is_disconnected)
+            if orders is None:
+                return
+            if not orders:
+                yield ": keepalive\n\n"
+            for order in orders:
+                yield f"id: {order['id']}\nevent: order\ndata: {json.dumps(order)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/orders/{order_id}/ack")
+async def ack_order(order_id: int, lease_id: str):
+    try:
+        await run_in_threadpool(order_queue.ack, order_id, lease_id)
+    except order_queue.LeaseLost as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": order_id, "status": order_queue.DONE}
+
+
+@app.post("/orders/{order_id}/fail")
+async def fail_order(order_id: int, lease_id: str, error: str = None, retry: bool = True):
+    try:
+        await run_in_threadpool(order_queue.fail, order_id, lease_id, error, retry)
+    except order_queue.LeaseLost as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": order_id, "status": order_queue.get_order(order_id)["status"]}
+
+
+@app.get("/orders/stats")
+async def order_stats():
+    return order_queue.stats()
+
+
+@app.get("/orders/{order_id}")
+async def order_status(order_id: int):
+    order = order_queue.get_order(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
 @app.get("/merged-videos", response_class=HTMLResponse)
 async def view_merged_videos(request: Request):
-    merged_files = sorted(
-        [f for f in Path(MERGE_DIR).glob("*.mp4") if f.is_file()],
-        key=lambda f: f.stat().st_ctime,
-        reverse=True
+    page = _query_int(request, "page")
+    selected_file = request.query_params.get("file")
+    return page_cache.cached_html(
+        request, ("merged-videos", page, selected_file), media_index.generation(),
+        lambda: _render_merged_videos_page(page, selected_file)
     )
 
-    selected_file = request.query_params.get("file")
-    selected_path = Path(MERGE_DIR) / selected_file if selected_file else None
+
+def _render_merged_videos_page(page, selected_file):
+    merged_count = media_index.count(media_index.MERGED)
+    page_count = max((merged_count + MERGED_PER_PAGE - 1) // MERGED_PER_PAGE, 1)
+    if page < 0 or page >= page_count:
+        page = 0
+    merged_files = media_index.list_media(
+        media_index.MERGED, offset=page * MERGED_PER_PAGE, limit=MERGED_PER_PAGE, newest_first=True
+    )
+
+    selected_video = media_index.get_media(media_index.MERGED, selected_file) if selected_file else None
 
     # Dropdown HTML
-    dropdown_html = '<form method="get" action="/merged-videos">\n<select name="file" onchange="this.form.submit()">\n'
-    for file in merged_files:
-        selected_attr = "selected" if selected_file == file.name else ""
-        dropdown_html += f'<option value="{file.name}" {selected_attr}>{file.name}</option>\n'
+    dropdown_html = '<form method="get" action="/merged-videos">\n'
+    dropdown_html += f'<input type="hidden" name="page" value="{page}">\n'
+    dropdown_html += '<select name="file" onchange="this.form.submit()">\n'
+    for video in merged_files:
+        selected_attr = "selected" if selected_file == video["name"] else ""
+        dropdown_html += f'<option value="{video["name"]}" {selected_attr}>{video["name"]}</option>\n'
     dropdown_html += "</select>\n</form>\n"
+    dropdown_html += _page_links("/merged-videos", page, page_count)
 
     # Video preview if valid file is selected
     video_player = ""
-    if selected_path and selected_path.is_file():
+    if selected_video:
         video_src = f"/merged/{selected_file}"
-        print(video_src)
+        poster_attr = f'poster="/merged/{selected_video["poster"]}"' if selected_video["poster"] else ""
+        # Browsers that play HLS natively take the playlist, the others the MP4
+        hls_source = f'<source src="/merged/{selected_video["hls"]}" type="application/vnd.apple.mpegurl">' \
+            if selected_video["hls"] else ""
         video_player = f"""
             <h3>{selected_file}</h3>
-            <video width="480" controls>
+            <video width="480" controls preload="metadata" {poster_attr}>
+                {hls_source}
                 <source src="{video_src}" type="video/mp4">
                 Your browser does not support the video tag.
             </video>
@@ -385,26 +731,41 @@ async def view_merged_videos(request: Request):
     </body>
     </html>
     """
-    return HTMLResponse(content=html)
+    return html
 
 @app.get("/merged-videos-list", response_class=HTMLResponse)
-async def merged_videos_list():
-    merged_files = sorted(
-        [f for f in Path(MERGE_DIR).glob("*.mp4") if f.is_file()],
-        key=lambda f: f.stat().st_ctime,
-        reverse=True
+async def merged_videos_list(request: Request):
+    page = _query_int(request, "page")
+    return page_cache.cached_html(
+        request, ("merged-videos-list", page), media_index.generation(),
+        lambda: _render_merged_videos_list(page)
+    )
+
+
+def _render_merged_videos_list(page):
+    merged_count = media_index.count(media_index.MERGED)
+    page_count = max((merged_count + MERGED_PER_PAGE - 1) // MERGED_PER_PAGE, 1)
+    if page < 0 or page >= page_count:
+        page = 0
+    merged_files = media_index.list_media(
+        media_index.MERGED, offset=page * MERGED_PER_PAGE, limit=MERGED_PER_PAGE, newest_first=True
     )
 
     videos_html = ""
-    for file in merged_files:
+    for video in merged_files:
+        # Only the poster is loaded up front, the small preview clip plays on hover
+        # and the full video opens from the link
+        poster_attr = f'poster="/merged/{video["poster"]}"' if video["poster"] else ""
+        preview_src = f"/merged/{video['preview']}" if video["preview"] else f"/merged/{video['name']}"
         videos_html += f"""
         <div style="display:inline-block; margin: 10px; text-align:center;">
-            <video width="200" controls>
-                <source src="/merged/{file.name}" type="video/mp4">
+            <video width="200" muted loop playsinline preload="none" {poster_attr}
+                   onmouseenter="this.play()" onmouseleave="this.pause()">
+                <source src="{preview_src}" type="video/mp4">
                 Your browser does not support the video tag.
             </video>
             <br>
-            <small>{file.name}</small>
+            <small><a href="/merged-videos?file={video['name']}">{video['name']}</a></small>
         </div>
         """
 
@@ -413,13 +774,14 @@ async def merged_videos_list():
     <head><title>All Merged Videos</title></head>
     <body>
         <h1>All Merged Videos</h1>
+        {_page_links("/merged-videos-list", page, page_count)}
         <div style="white-space: nowrap; overflow-x: auto;">
             {videos_html if videos_html else "<p>No merged videos found.</p>"}
         </div>
     </body>
     </html>
     """
-    return HTMLResponse(content=html)
+    return html
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+
+# Index of the uploaded and merged videos, so pages don't have to scan and stat
+# the directories on every request
+MEDIA_DB = os.environ.get("MEDIA_DB", str(Path(__file__).resolve().parent / "media_index.sqlite3"))
+
+UPLOAD = "upload"
+MERGED = "merged"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    ctime REAL,
+    duration REAL,
+    fps REAL,
+    frame_count INTEGER,
+    width INTEGER,
+    height INTEGER,
+    sha256 TEXT,
+    video1 TEXT,
+    video2 TEXT,
+    poster TEXT,
+    preview TEXT,
+    hls TEXT,
+    PRIMARY KEY (kind, name)
+);
+CREATE INDEX IF NOT EXISTS media_kind_ctime ON media (kind, ctime);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Columns added after the first release, created on databases that predate them
+_ADDED_COLUMNS = {"poster": "TEXT", "preview": "TEXT", "hls": "TEXT"}
+# Kept from the existing row when add_media is called without them
+_KEPT_COLUMNS = ("sha256", "video1", "video2", "poster", "preview", "hls")
+# Describe the content itself, only kept while the file's size and mtime are unchanged
+_CONTENT_COLUMNS = ("sha256",)
+
+_initialized = set()
+
+
+def connect():
+    conn = sqlite3.connect(MEDIA_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if MEDIA_DB not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(media)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE media ADD COLUMN {column} {column_type}")
+        conn.commit()
+        _initialized.add(MEDIA_DB)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    A connection that commits (or rolls back) and is closed when the block ends.
+    The connection's own context manager only does the former.
+    """
+    conn = connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def probe_video(path):
+    cap = cv2.VideoCapture(str(path))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    info = {
+        "fps": fps or None,
+        "frame_count": frame_count,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "duration": frame_count / fps if fps else None,
+    }
+    cap.release()
+    return info
+
+
+def _bump_generation(conn):
+    # Changes whenever the index does, pages cached against it are stale after a bump
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+
+def generation():
+    with transaction() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row["value"] if row else 0
+
+
+def add_media(kind, path, sha256=None, video1=None, video2=None, poster=None, preview=None, hls=None):
+    """
+    Record (or refresh) an uploaded or merged video after it was written.
+    poster, preview and hls (the playlist) are paths relative to the video's directory.
+    """
+    path = Path(path)
+    stat = path.stat()
+    row = {
+        "kind": kind,
+        "name": path.name,
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "ctime": stat.st_ctime,
+        "sha256": sha256,
+        "video1": video1,
+        "video2": video2,
+        "poster": poster,
+        "preview": preview,
+        "hls": hls,
+        **probe_video(path),
+    }
+    with transaction() as conn:
+        existing = conn.execute("SELECT * FROM media WHERE kind = ? AND name = ?", (kind, path.name)).fetchone()
+        if existing is not None:
+            if existing["ctime"]:
+                # Keep the original position of the file in the listings
+                row["ctime"] = min(existing["ctime"], row["ctime"])
+            unchanged = existing["size"] == row["size"] and existing["mtime"] == row["mtime"]
+            for column in _KEPT_COLUMNS:
+                if row[column] is None and (unchanged or column not in _CONTENT_COLUMNS):
+                    row[column] = existing[column]
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{column}" for column in row)
+        conn.execute(f"INSERT OR REPLACE INTO media ({columns}) VALUES ({placeholders})", row)
+        _bump_generation(conn)
+
+
+def reconcile(kind, directory):
+    """
+    Bring the index in line with the *.mp4 files in directory: add new or changed
+    files and drop rows whose file is gone. Run on startup.
+    """
+    on_disk = {f.name: f for f in Path(directory).glob("*.mp4") if f.is_file()}
+    with transaction() as conn:
+        indexed = {
+            row["name"]: row
+            for row in conn.execute("SELECT name, size, mtime FROM media WHERE kind = ?", (kind,))
+        }
+        gone = [name for name in indexed if name not in on_disk]
+        conn.executemany("DELETE FROM media WHERE kind = ? AND name = ?", [(kind, name) for name in gone])
+        if gone:
+            _bump_generation(conn)
+
+    for name, path in on_disk.items():
+        stat = path.stat()
+        row = indexed.get(name)
+        if row is None or row["size"] != stat.st_size or row["mtime"] != stat.st_mtime:
+            add_media(kind, path, **_existing_derivatives(kind, path))
+
+
+def _existing_derivatives(kind, path):
+    if kind != MERGED:
+        return {}
+    # Both import this module
+    from merge_two_videos.previews import preview_paths
+    from merge_two_videos.hls import hls_dir, HLS_PLAYLIST
+
+    derivatives = {}
+    poster_path, clip_path = preview_paths(path)
+    for column, derivative_path in (("poster", poster_path), ("preview", clip_path),
+                                    ("hls", hls_dir(path) / HLS_PLAYLIST)):
+        if derivative_path.exists():
+            derivatives[column] = derivative_path.relative_to(path.parent).as_posix()
+    return derivatives
+
+
+def count(kind):
+    with transaction() as conn:
+        return conn.execute("SELECT COUNT(*) FROM media WHERE kind = ?", (kind,)).fetchone()[0]
+
+
+def get_media(kind, name):
+    with transaction() as conn:
+        row = conn.execute("SELECT * FROM media WHERE kind = ? AND name = ?", (kind, name)).fetchone()
+    return dict(row) if row else None
+
+
+def recorded_sha256(path):
+    """
+    The SHA-256 the file at path was stored with (see upload_store), so it does not
+    have to be hashed again. None when the index has no hash for it or the file
+    changed since it was recorded.
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    with transaction() as conn:
+        rows = conn.execute(
+            "SELECT path, size, mtime, sha256 FROM media WHERE name = ? AND sha256 IS NOT NULL", (path.name,)
+        ).fetchall()
+    for row in rows:
+        if row["size"] != stat.st_size or row["mtime"] != stat.st_mtime:
+            continue
+        try:
+            if os.path.samefile(row["path"], path):
+                return row["sha256"]
+        except OSError:
+            continue
+    return None
+
+
+def list_media(kind, offset=0, limit=None, newest_first=False):
+    order = "DESC" if newest_first else "ASC"
+    with transaction() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM media WHERE kind = ? ORDER BY ctime {order}, name {order} LIMIT ? OFFSET ?",
+            (kind, -1 if limit is None else limit, offset)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def upload_pair(pair_index):
+    """
+    Uploads are paired in upload order: pair i is the (2i)th and (2i + 1)th upload.
+    """
+    return list_media(UPLOAD, offset=pair_index * 2, limit=2)
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import signal
+from pathlib import Path
+
+from merge_two_videos import job_store, worker
+
+# Render workers started alongside the API. Rendering normally runs in separate
+# `python -m merge_two_videos.worker` processes, set this to render in a single box setup.
+MERGE_WORKERS = int(os.environ.get("MERGE_WORKERS", "0"))
+
+_workers = []
+
+
+def submit_merge(video1_path, video2_path, bg1_path, bg2_path, output_path, edl=None):
+    """
+    Queue a merge in the job store and return its job id right away.
+
+    :param edl: Edit decision list to render, found from the silences when omitted.
+    """
+    return job_store.add_job(
+        Path(video1_path).resolve(),
+        Path(video2_path).resolve(),
+        Path(bg1_path).resolve(),
+        Path(bg2_path).resolve(),
+        Path(output_path).resolve(),
+        edl,
+    )
+
+
+def get_job(job_id):
+    return job_store.get_job(job_id)
+
+
+def list_jobs():
+    return job_store.list_jobs()
+
+
+def start_workers(count=MERGE_WORKERS):
+    # Not daemonic: a worker may run ffmpeg children and finishes its job on shutdown.
+    # forkserver: the server has threads (e.g. the threadpool of its handlers), which fork does not mix with
+    context = multiprocessing.get_context("forkserver")
+    for _ in range(count):
+        process = context.Process(target=_run_worker, name="merge-worker")
+        process.start()
+        _workers.append(process)
+
+
+def _run_worker():
+    signal.signal(signal.SIGTERM, worker._request_stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the API process decides when we stop
+    worker.run()
+
+
+def shutdown():
+    for process in _workers:
+        if process.is_alive():
+            process.terminate()  # SIGTERM, the worker stops after its current job
+    _workers.clear()
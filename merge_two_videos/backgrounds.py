@@ -0,0 +1,118 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# === Decoded + center-cropped backgrounds, keyed by (content hash, crop size) ===
+BACKGROUND_CACHE_DIR = Path(os.environ.get(
+    "BACKGROUND_CACHE_DIR", Path(__file__).resolve().parent.parent / "temp_backgrounds"
+))
+BACKGROUND_MEMORY_ENTRIES = int(os.environ.get("BACKGROUND_MEMORY_ENTRIES", "16"))
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def center_crop(image, target_w, target_h):
+    w, h = image.size
+    left = (w - target_w) // 2
+    upper = (h - target_h) // 2
+    right = left + target_w
+    lower = upper + target_h
+    return image.crop((left, upper, right, lower))
+
+
+def _remember(key, image):
+    with _lock:
+        _memory[key] = image
+        _memory.move_to_end(key)
+        while len(_memory) > BACKGROUND_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _recall(key):
+    with _lock:
+        image = _memory.get(key)
+        if image is not None:
+            _memory.move_to_end(key)
+        return image
+
+
+def cropped_background(data, target_w, target_h, digest=None):
+    """
+    Decode an uploaded background and center-crop it to target_w x target_h.
+
+    The result is kept in a bounded in-memory LRU and stored once on disk as
+    <hash>_<w>x<h>.png, so repeated uploads of the same image skip the work.
+
+    :param data: Bytes of the uploaded image.
+    :param target_w: Width of the crop.
+    :param target_h: Height of the crop.
+    :param digest: SHA-256 of data, if already known.
+    :return: (BGR array, path of the cached PNG)
+    """
+    digest = digest or hashlib.sha256(data).hexdigest()
+    path = BACKGROUND_CACHE_DIR / f"{digest}_{target_w}x{target_h}.png"
+    key = str(path)
+
+    image = _recall(key)
+    if image is not None:
+        return image, path
+
+    if path.exists():
+        image = cv2.imread(key)
+    if image is None:
+        rgb = center_crop(Image.open(io.BytesIO(data)).convert("RGB"), target_w, target_h)
+        image = cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2BGR)
+
+        BACKGROUND_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.png")
+        cv2.imwrite(str(temp_path), image)
+        os.replace(temp_path, path)
+
+    image.flags.writeable = False  # shared between merges
+    _remember(key, image)
+    return image, path
+
+
+def prepare_backgrounds(data1, data2):
+    """
+    Center-crop two uploaded backgrounds to their common (smaller) size.
+
+    :return: ((BGR array 1, path 1), (BGR array 2, path 2))
+    """
+    # Only the image headers are read to get the sizes
+    width1, height1 = Image.open(io.BytesIO(data1)).size
+    width2, height2 = Image.open(io.BytesIO(data2)).size
+    target_width = min(width1, width2)
+    target_height = min(height1, height2)
+
+    return (
+        cropped_background(data1, target_width, target_height),
+        cropped_background(data2, target_width, target_height),
+    )
+
+
+def load_background(background):
+    """
+    Background for the compositor: an array is used as is, a path is read through
+    the in-memory LRU.
+    """
+    if isinstance(background, np.ndarray):
+        return background
+
+    key = str(background)
+    image = _recall(key)
+    if image is None:
+        image = cv2.imread(key)
+        if image is None:
+            raise FileNotFoundError(f"Could not read background image: {background}")
+        image.flags.writeable = False
+        _remember(key, image)
+    return image
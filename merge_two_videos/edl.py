@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+
+import media_index
+from merge_two_videos import spans
+from merge_two_videos.frame_pipeline import run_pipeline
+from merge_two_videos.frame_sink import FrameSink
+
+# === Edit decision list: which speaker is on screen, frame range by frame range ===
+#
+# {"fps": 30.0, "frames": 300, "cuts": [{"start": 0, "end": 120, "source": 1}, ...]}
+#
+# Cuts are contiguous, end is exclusive. Source 1 or 2 shows that video, BLACK shows
+# nothing. From the pruned silence masks: the first video while it is not silent,
+# else the second while it is not silent, else black. The first video wins when both
+# talk, it was the top layer of the old black-key blend.
+
+BLACK = 0
+SOURCES = (BLACK, 1, 2)
+# Mix of the audio of both videos
+AUDIO_MIX = "amix=inputs=2:duration=shortest"
+# The masks follow the audio, which rarely ends on the last video frame: an EDL may
+# be this many seconds longer or shorter than the shortest video
+EDL_SLACK_SECONDS = 0.5
+
+
+def build_edl(mask_1, mask_2, fps):
+    """
+    :param mask_1: Pruned silence mask of the first video (1 = silent).
+    :param mask_2: Pruned silence mask of the second video (1 = silent).
+    :param fps: Frame rate the masks are aligned to.
+    """
+    frame_count = min(len(mask_1), len(mask_2))
+    mask_1 = np.asarray(mask_1[:frame_count])
+    mask_2 = np.asarray(mask_2[:frame_count])
+    sources = np.where(mask_1 == 0, 1, np.where(mask_2 == 0, 2, BLACK))
+
+    boundaries = np.flatnonzero(np.diff(sources)) + 1
+    starts = np.concatenate(([0], boundaries)) if frame_count else []
+    ends = np.concatenate((boundaries, [frame_count])) if frame_count else []
+    return {
+        "fps": float(fps),
+        "frames": int(frame_count),
+        "cuts": [
+            {"start": int(start), "end": int(end), "source": int(sources[start])}
+            for start, end in zip(starts, ends)
+        ],
+    }
+
+
+def validate_edl(edl):
+    """
+    Check an EDL that comes from outside (e.g. edited before a re-render).
+
+    :raises ValueError: When it is not a well-formed EDL.
+    """
+    try:
+        fps = float(edl["fps"])
+        frame_count = edl["frames"]
+        cuts = edl["cuts"]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("An EDL needs fps, frames and cuts")
+    if fps <= 0 or not isinstance(frame_count, int) or frame_count < 0:
+        raise ValueError("fps must be positive and frames a frame count")
+    position = 0
+    for cut in cuts:
+        if not isinstance(cut, dict) or cut.get("start") != position:
+            raise ValueError(f"Cuts must be contiguous from frame 0, expected a cut starting at {position}")
+        end = cut.get("end")
+        if not isinstance(end, int) or end <= position:
+            raise ValueError(f"Cut at {position} must end after it starts")
+        if cut.get("source") not in SOURCES:
+            raise ValueError(f"Cut at {position} has source {cut.get('source')!r}, expected one of {SOURCES}")
+        position = end
+    if position != frame_count:
+        raise ValueError(f"Cuts cover {position} frames, the EDL has {frame_count}")
+    return edl
+
+
+def check_edl_sources(edl, video1_path, video2_path):
+    """
+    Check a (valid) EDL against the videos it will be rendered from: the same frame
+    rate, and about as many frames as the shortest of them.
+
+    :raises ValueError: When the EDL was not made for these videos.
+    """
+    probes = [media_index.probe_video(path) for path in (video1_path, video2_path)]
+    for path, probe in zip((video1_path, video2_path), probes):
+        if not probe["fps"] or not probe["frame_count"]:
+            raise ValueError(f"Cannot read the frame rate and length of {path}")
+        if abs(probe["fps"] - edl["fps"]) > 0.01:
+            raise ValueError(f"The EDL is at {edl['fps']:g} fps, {path} at {probe['fps']:g} fps")
+    frame_count = min(probe["frame_count"] for probe in probes)
+    if abs(edl["frames"] - frame_count) > EDL_SLACK_SECONDS * edl["fps"]:
+        raise ValueError(f"The EDL has {edl['frames']} frames, the videos {frame_count}")
+    return edl
+
+
+def audio_mix(edl):
+    """
+    The AUDIO_MIX of two inputs cut to the length of the EDL, so the audio never
+    runs past its last frame.
+    """
+    return f"{AUDIO_MIX},atrim=duration={edl['frames'] / edl['fps']:.6f}"
+
+
+def frame_sources(edl, start=0, end=None):
+    """
+    The source of every frame of [start, end) of the EDL.
+    """
+    sources = np.full(edl["frames"], BLACK, dtype=np.uint8)
+    for cut in edl["cuts"]:
+        sources[cut["start"]:cut["end"]] = cut["source"]
+    return sources[start:end]
+
+
+@spans.stage("cut")
+def render_edl(edl, video1_path, video2_path, final_output):
+    """
+    Render an EDL from two finished legs (e.g. the outputs of put_video_on_background)
+    by taking each frame from the active leg. The frames of the other leg are skipped
+    without being converted, the audio of both legs is mixed.
+    """
+    cap1 = cv2.VideoCapture(str(video1_path))
+    cap2 = cv2.VideoCapture(str(video2_path))
+    width = int(cap1.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap1.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    black = np.zeros((height, width, 3), dtype=np.uint8)
+    sources = frame_sources(edl)
+    frame_indices = iter(range(len(sources)))
+
+    def read_frame():
+        frame_idx = next(frame_indices, None)
+        if frame_idx is None:
+            return False, None
+        source = sources[frame_idx]
+        ret1, frame1 = cap1.read() if source == 1 else (cap1.grab(), None)
+        ret2, frame2 = cap2.read() if source == 2 else (cap2.grab(), None)
+        return ret1 and ret2, frame1 if source == 1 else frame2 if source == 2 else black
+
+    print(f"✂️ Cutting {len(edl['cuts'])} segments...")
+    try:
+        with FrameSink(
+            final_output, width, height, edl["fps"],
+            audio_inputs=[video1_path, video2_path],
+            audio_filter=f"[1:a][2:a]{audio_mix(edl)}[aout]"
+        ) as out:
+            run_pipeline(read_frame, lambda frame: frame, out.write, name="cut")
+    finally:
+        cap1.release()
+        cap2.release()
+    print("✅ Merged video saved at:", final_output)
@@ -0,0 +1,200 @@
+import os
+import queue
+import threading
+import time
+
+# === Pipelined frame loops: decode -> compute -> encode ===
+#
+# A reader thread decodes (and does whatever has to happen in frame order, like
+# tracking), a pool of compute threads works on frames out of order, and the
+# calling thread writes the results back in order. Bounded queues give backpressure.
+# OpenCV and numpy release the GIL in decoding, color conversions and array
+# operations, and the encoder is a separate ffmpeg process, so the stages overlap.
+
+# Compute threads per frame loop, 0 runs the loop serially in the calling thread
+PIPELINE_THREADS = int(os.environ.get("MERGE_PIPELINE_THREADS", str(min(4, os.cpu_count() or 1))))
+# Frames waiting between two stages
+PIPELINE_QUEUE_SIZE = int(os.environ.get("MERGE_PIPELINE_QUEUE_SIZE", "8"))
+
+_END = object()
+_POLL_SECONDS = 0.1
+
+
+class PipelineStats:
+    """
+    Busy time of each stage of a run_pipeline call. Utilization is busy time over
+    wall time (per thread for compute): a stage near 100% is the bottleneck.
+    """
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.frames = 0
+        self.read_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.write_seconds = 0.0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_compute(self, seconds):
+        with self._lock:
+            self.compute_seconds += seconds
+
+    def utilization(self):
+        if not self.seconds:
+            return {"read": 0.0, "compute": 0.0, "write": 0.0}
+        return {
+            "read": self.read_seconds / self.seconds,
+            "compute": self.compute_seconds / (self.seconds * max(self.threads, 1)),
+            "write": self.write_seconds / self.seconds,
+        }
+
+    def __str__(self):
+        utilization = self.utilization()
+        fps = self.frames / self.seconds if self.seconds else 0.0
+        threads = f"{self.threads} threads" if self.threads else "serial"
+        return (f"{self.frames} frames at {fps:.1f} fps, read {utilization['read']:.0%}, "
+                f"compute {utilization['compute']:.0%} ({threads}), write {utilization['write']:.0%}")
+
+
+def _put(q, item, failed):
+    while not failed.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, failed):
+    while not failed.is_set():
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _END
+
+
+def _run_serial(read, process, write, stats):
+    while True:
+        start = time.perf_counter()
+        ok, item = read()
+        read_done = time.perf_counter()
+        stats.read_seconds += read_done - start
+        if not ok:
+            return
+        result = process(item)
+        compute_done = time.perf_counter()
+        stats.compute_seconds += compute_done - read_done
+        write(result)
+        stats.write_seconds += time.perf_counter() - compute_done
+        stats.frames += 1
+
+
+def run_pipeline(read, process, write, threads=None, queue_size=None, name=None):
+    """
+    Run `write(process(item))` for every item read, with read, process and write of
+    different frames overlapping.
+
+    :param read: Returns (ok, item) like cv2.VideoCapture.read, ok False at the end.
+        Always called from the same thread, in order, so it may keep state.
+    :param process: Turns an item into a result. Runs on several threads at once.
+    :param write: Takes the results in read order, in the calling thread.
+    :param threads: Compute threads, PIPELINE_THREADS when omitted (0 = all serial).
+    :param queue_size: Frames buffered between stages, PIPELINE_QUEUE_SIZE when omitted.
+    :param name: Printed with the stage utilization when given.
+    :return: PipelineStats of the run.
+    """
+    threads = PIPELINE_THREADS if threads is None else threads
+    queue_size = queue_size or PIPELINE_QUEUE_SIZE
+    stats = PipelineStats(threads)
+    started = time.perf_counter()
+    if threads < 1:
+        _run_serial(read, process, write, stats)
+        stats.seconds = time.perf_counter() - started
+        if name:
+            print(f"⏱️ {name}: {stats}")
+        return stats
+
+    to_compute = queue.Queue(queue_size)
+    to_write = queue.Queue(queue_size)
+    # Frames between being read and written, bounds the reordering buffer too
+    in_flight = threading.Semaphore(2 * queue_size + threads)
+    failed = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            index = 0
+            while not failed.is_set():
+                if not in_flight.acquire(timeout=_POLL_SECONDS):
+                    continue
+                start = time.perf_counter()
+                ok, item = read()
+                stats.read_seconds += time.perf_counter() - start
+                if not ok or not _put(to_compute, (index, item), failed):
+                    break
+                index += 1
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            for _ in range(threads):
+                _put(to_compute, _END, failed)
+
+    def computer():
+        try:
+            while True:
+                task = _get(to_compute, failed)
+                if task is _END:
+                    break
+                index, item = task
+                start = time.perf_counter()
+                result = process(item)
+                stats.add_compute(time.perf_counter() - start)
+                if not _put(to_write, (index, result), failed):
+                    break
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            _put(to_write, _END, failed)
+
+    workers = [threading.Thread(target=reader, name="frame-reader", daemon=True)]
+    workers += [threading.Thread(target=computer, name=f"frame-compute-{i}", daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        pending = {}
+        next_index = 0
+        finished = 0
+        while finished < threads:
+            task = _get(to_write, failed)
+            if task is _END:
+                if failed.is_set():
+                    break
+                finished += 1
+                continue
+            index, result = task
+            pending[index] = result
+            while next_index in pending:
+                start = time.perf_counter()
+                write(pending.pop(next_index))
+                stats.write_seconds += time.perf_counter() - start
+                stats.frames += 1
+                next_index += 1
+                in_flight.release()
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        for worker in workers:
+            worker.join()
+    if errors:
+        raise errors[0]
+
+    stats.seconds = time.perf_counter() - started
+    if name:
+        print(f"⏱️ {name}: {stats}")
+    return stats
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import time
+
+import numpy as np
+
+from merge_two_videos import spans
+
+# === Encoder settings used by every stage (overridable per sink) ===
+ENCODER_SETTINGS = {
+    "codec": os.environ.get("MERGE_VIDEO_CODEC", "libx264"),
+    "crf": int(os.environ.get("MERGE_VIDEO_CRF", "20")),
+    "preset": os.environ.get("MERGE_VIDEO_PRESET", "veryfast"),
+    "audio_codec": os.environ.get("MERGE_AUDIO_CODEC", "aac"),
+    "faststart": os.environ.get("MERGE_FASTSTART", "1") == "1",
+    # A keyframe at least this often, so players can seek and HLS can cut segments
+    # without re-encoding (0 leaves it to the encoder)
+    "keyframe_seconds": float(os.environ.get("MERGE_KEYFRAME_SECONDS", "2")),
+}
+
+
+class FrameSink:
+    """
+    Pipes raw BGR frames into a single ffmpeg process that encodes the video,
+    muxes the audio of the given inputs and writes the finished file in one step.
+
+    :param output_path: Path of the finished video.
+    :param width: Frame width in pixels.
+    :param height: Frame height in pixels.
+    :param fps: Frame rate of the piped frames.
+    :param audio_inputs: Files whose audio goes into the output. A single input is
+        mapped as is (if it has audio), several inputs need an audio_filter.
+    :param audio_filter: filter_complex graph over the audio inputs producing [aout].
+    :param encoder: Overrides for ENCODER_SETTINGS (codec, crf, preset, audio_codec, faststart,
+        keyframe_seconds).
+    """
+
+    def __init__(self, output_path, width, height, fps, audio_inputs=(), audio_filter=None, **encoder):
+        settings = dict(ENCODER_SETTINGS, **encoder)
+        self.output_path = str(output_path)
+        self.width = width
+        self.height = height
+        self.frames_written = 0
+
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+        ]
+        for audio_input in audio_inputs:
+            cmd += ["-i", str(audio_input)]
+
+        # No -shortest: it trims the video to the audio, which can end a frame early
+        cmd += ["-map", "0:v"]
+        if audio_filter:
+            cmd += ["-filter_complex", audio_filter, "-map", "[aout]"]
+        elif audio_inputs:
+            cmd += ["-map", "1:a?"]
+
+        # yuv420p needs even dimensions
+        if width % 2 or height % 2:
+            cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        cmd += ["-c:v", settings["codec"], "-pix_fmt", "yuv420p"]
+        if settings["preset"]:
+            cmd += ["-preset", settings["preset"]]
+        if settings["crf"] is not None:
+            cmd += ["-crf", str(settings["crf"])]
+        if settings["keyframe_seconds"]:
+            cmd += ["-force_key_frames", f"expr:gte(t,n_forced*{settings['keyframe_seconds']:g})"]
+        if audio_inputs:
+            cmd += ["-c:a", settings["audio_codec"]]
+        if settings["faststart"]:
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(self.output_path)
+
+        self.cmd = cmd
+        self._started = time.perf_counter()
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames_written += 1
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+        spans.add(
+            frames=self.frames_written,
+            bytes_written=os.path.getsize(self.output_path),
+            subprocess_seconds=time.perf_counter() - self._started,
+        )
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
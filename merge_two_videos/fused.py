@@ -0,0 +1,81 @@
+import numpy as np
+
+from merge_two_videos import spans
+from merge_two_videos.backgrounds import load_background
+from merge_two_videos.edl import audio_mix, frame_sources
+from merge_two_videos.frame_pipeline import run_pipeline
+from merge_two_videos.frame_sink import FrameSink
+from merge_two_videos.keying import paste_layer
+from merge_two_videos.layer_cache import KeyedLayers
+
+
+@spans.stage("render")
+def fused_merge(video1_path, video2_path, bg_1, bg_2, edl, final_output, scale_factor=0.6, tracking=True,
+                use_cache=None):
+    """
+    Single-pass version of put_video_on_background + render_edl.
+    Each green-screen source is decoded once (or not at all when its keyed layers are
+    cached); keying and compositing happen in memory, only for the source the EDL
+    shows, and only the final video is encoded.
+
+    :param video1_path: Path to the first green-screen video.
+    :param video2_path: Path to the second green-screen video.
+    :param bg_1: Background image (path or BGR array) of the first video.
+    :param bg_2: Background image (path or BGR array) of the second video.
+    :param edl: Edit decision list saying which video is shown when (see merge_two_videos.edl).
+    :param final_output: Final output path for the video with the mixed audio.
+    :param scale_factor: Factor by which to scale the subjects.
+    :param tracking: Track the subjects between frames instead of searching every full frame.
+    :param use_cache: Read and write the layer cache, LAYER_CACHE_ENABLED when omitted.
+    """
+    bg_image_1 = load_background(bg_1)
+    bg_image_2 = load_background(bg_2)
+    frame_height, frame_width = bg_image_1.shape[:2]
+
+    # Keyed subject layers, straight from the layer cache when these clips were keyed before
+    layers1 = KeyedLayers(video1_path, scale_factor, tracking=tracking, use_cache=use_cache)
+    layers2 = KeyedLayers(video2_path, scale_factor, tracking=tracking, use_cache=use_cache)
+    fps = layers1.fps
+
+    # === Encode the cuts and mix both source audio tracks in one ffmpeg process ===
+    print("🎞️ Rendering merged video in a single pass...")
+    with layers1, layers2, FrameSink(
+        final_output, frame_width, frame_height, fps,
+        audio_inputs=[video1_path, video2_path],
+        audio_filter=f"[1:a][2:a]{audio_mix(edl)}[aout]"
+    ) as out:
+        render_frames(out, layers1, layers2, bg_image_1, bg_image_2, frame_sources(edl))
+
+    print("✅ Merged video saved at:", final_output)
+
+
+def render_frames(out, layers1, layers2, bg_image_1, bg_image_2, sources, threads=None):
+    """
+    Composite the frames of the source each frame shows into out, for as many frames
+    as there are sources.
+
+    :param sources: Source of every frame (see frame_sources).
+    :param threads: Compute threads of the frame pipeline (see run_pipeline).
+    """
+    black = np.zeros_like(bg_image_1)
+    frame_indices = iter(range(len(sources)))
+
+    def read_layers():
+        frame_idx = next(frame_indices, None)
+        if frame_idx is None:
+            return False, None
+        # Only the shown source needs its layer, the other one is just kept in step
+        source = sources[frame_idx]
+        ret1, key1 = layers1.read_deferred(wanted=source == 1)
+        ret2, key2 = layers2.read_deferred(wanted=source == 2)
+        return ret1 and ret2, (source, key1, key2)
+
+    def composite(task):
+        source, key1, key2 = task
+        if source == 1:
+            return paste_layer(bg_image_1, key1())
+        if source == 2:
+            return paste_layer(bg_image_2, key2())
+        return black
+
+    run_pipeline(read_layers, composite, out.write, threads, name="render")
@@ -0,0 +1,77 @@
+"""
+HLS packaging of merged videos: fMP4 segments and a VOD playlist, so playback can
+start after the first segment instead of after most of the file.
+
+For <merged dir>/<name>.mp4 the playlist is <merged dir>/<name>/index.m3u8, served
+as /merged/<name>/index.m3u8. Workers package new outputs when MERGE_HLS=1; for
+older outputs run
+
+    python -m merge_two_videos.hls [merged dir]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import media_index
+
+HLS_ENABLED = os.environ.get("MERGE_HLS", "0") == "1"
+# Segments are cut at keyframes, see keyframe_seconds in ENCODER_SETTINGS
+HLS_SEGMENT_SECONDS = float(os.environ.get("MERGE_HLS_SEGMENT_SECONDS", "4"))
+HLS_PLAYLIST = "index.m3u8"
+
+
+def hls_dir(output_path):
+    output_path = Path(output_path)
+    return output_path.parent / output_path.stem
+
+
+def package_hls(video_path, out_dir, segment_seconds=HLS_SEGMENT_SECONDS):
+    """
+    Split a video into fMP4 segments plus playlist without re-encoding it.
+
+    :param video_path: The MP4 to package.
+    :param out_dir: Directory that will hold index.m3u8, init.mp4 and the segments.
+        It is replaced as a whole once packaging succeeded.
+    :return: Path of the playlist.
+    """
+    out_dir = Path(out_dir)
+    temp_dir = out_dir.with_name(f".{out_dir.name}.{os.getpid()}.hls")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    try:
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error", "-i", str(video_path),
+            "-map", "0", "-c", "copy",
+            "-f", "hls", "-hls_time", f"{segment_seconds:g}", "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", str(temp_dir / "segment_%05d.m4s"),
+            str(temp_dir / HLS_PLAYLIST),
+        ], check=True)
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        os.replace(temp_dir, out_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return out_dir / HLS_PLAYLIST
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("merged_dir", nargs="?", default="merged")
+    parser.add_argument("--force", action="store_true", help="repackage existing outputs")
+    args = parser.parse_args()
+
+    for output_path in sorted(Path(args.merged_dir).glob("*.mp4")):
+        playlist = hls_dir(output_path) / HLS_PLAYLIST
+        if args.force or not playlist.exists():
+            package_hls(output_path, hls_dir(output_path))
+            print(f"📦 {output_path.name}")
+        media_index.add_media(
+            media_index.MERGED, output_path, hls=playlist.relative_to(output_path.parent).as_posix()
+        )
+
+
+if __name__ == "__main__":
+    main()
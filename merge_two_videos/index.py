@@ -1,7 +1,60 @@
+from merge_two_videos import layer_cache, spans, workspace
 from merge_two_videos.put_video_on_bg import put_video_on_background
-from merge_two_videos.make_video_with_opacity import make_video_with_opacity,make_video_with_mask
-from merge_two_videos.merge_videos import merge_videos
+from merge_two_videos.make_video_with_opacity import make_video_with_opacity
+from merge_two_videos.edl import build_edl, render_edl
+from merge_two_videos.fused import fused_merge
+from merge_two_videos.silence import video_fps
+from merge_two_videos.segments import SEGMENT_PROCESSES, segmented_merge
+import multiprocessing
 import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+# "fused" renders in a single pass, "files" runs the original stage-by-stage pipeline
+MERGE_ENGINE = os.environ.get("MERGE_ENGINE", "fused")
+# The files engine renders the two legs in two processes at the same time (on by
+# default when there is more than one core)
+PARALLEL_LEGS = os.environ.get("MERGE_PARALLEL_LEGS", "1" if (os.cpu_count() or 1) > 1 else "0") == "1"
+# Every pair of pruned masks is appended here (one line per mask), empty to disable
+MASK_LOG = os.environ.get("MERGE_MASK_LOG", str(Path(__file__).resolve().parent.parent / "frames.txt"))
+
+def _prune_pass(current, other):
+    """
+    One left-to-right pass of the pruning over current, vectorized.
+
+    Positions where current is 0 (or -1) are "open". A position that is 1 in both
+    arrays right after an open one is closed (set to 0), and the closing carries on
+    through the whole run of such positions, just like the original per-element
+    loop. The position right before an open one is closed as well (never index 0).
+    """
+    n = len(current)
+    result = current.copy()
+    if n < 2:
+        return result
+
+    is_open = (current == 0) | (current == -1)
+    both_on = (current == 1) & (other == 1)
+
+    # Forward: runs of both_on that directly follow an open position
+    run_start = both_on & ~np.concatenate(([False], both_on[:-1]))
+    run_id = np.cumsum(run_start)
+    follows_open = np.zeros(run_id[-1] + 1, dtype=bool)
+    starts = np.flatnonzero(run_start)
+    starts = starts[starts > 0]
+    follows_open[run_id[starts]] = is_open[starts - 1]
+    forward = both_on & follows_open[run_id]
+
+    # Backward: the position before an open one (positions 1 .. n-2)
+    backward = np.zeros(n, dtype=bool)
+    backward[1:-1] = both_on[1:-1] & is_open[2:]
+
+    result[forward | backward] = 0
+    return result
+
+
+@spans.stage("prune")
 def prune_sandwiched_zeros(arr1, arr2, iterations=30):
     output1=[]
     output2=[]
@@ -13,61 +66,116 @@ def prune_sandwiched_zeros(arr1, arr2, iterations=30):
     arr1 = np.array(arr1, dtype=int)
     arr2 = np.array(arr2, dtype=int)
 
+    unchanged = 0
     for iteration in range(iterations):
-        current = arr1 if iteration % 2 == 0 else arr2
-        other = arr2 if iteration % 2 == 0 else arr1
-
-        new_array = current
-        for i in range(len(current)):
-            if current[i] == 0 or current[i] == -1:
-                
-                if(i-1>0):
-
-                    #print(current[i-1])
-                    if(current[i-1]==1 and other[i-1]==1):
-                        current[i-1]=0
-
-                if(i+1<len(current)):
-                    if(current[i+1]==1 and (i+1==len(other) or other[i+1]==1)):
-                        current[i+1]=0
-
         if iteration % 2 == 0:
-            output1=current
+            new_array = _prune_pass(arr1, arr2)
+            unchanged = unchanged + 1 if np.array_equal(new_array, arr1) else 0
+            arr1 = output1 = new_array
         else:
-            output2=current
-
+            new_array = _prune_pass(arr2, arr1)
+            unchanged = unchanged + 1 if np.array_equal(new_array, arr2) else 0
+            arr2 = output2 = new_array
 
+        # Two passes in a row without a change: every later pass is a no-op too
+        if unchanged >= 2:
+            output1, output2 = arr1, arr2
+            break
 
     return output1,output2
 
-def merge_two_videos_into_one(video_path1,video_path_2,bg_1,bg_2,final_output_path):
-    
-    
-    video_path = video_path1
-    background_path = bg_1
-    final_output_path_1 = "video_path1.mp4"
-    put_video_on_background(video_path, background_path, final_output_path_1)
-    mask_1 = make_video_with_opacity(final_output_path_1)
-
-
-    video_path = video_path_2
-    background_path = bg_2
-    final_output_path_2 = "video_path_2.mp4"
-    put_video_on_background(video_path, background_path, final_output_path_2)
-    mask_2 = make_video_with_opacity(final_output_path_2)
-
-
+@spans.stage("merge")
+def merge_two_videos_into_one(video_path1,video_path_2,bg_1,bg_2,final_output_path,engine=None,work_dir=None,edl=None,
+                              use_cache=None):
+    """
+    :param work_dir: Directory for the intermediate files, a fresh workspace that is
+        removed afterwards when omitted. Concurrent merges must not share one.
+    :param edl: Edit decision list to render (see merge_two_videos.edl), computed from
+        the silences of the videos when omitted.
+    :param use_cache: Use the layer cache, LAYER_CACHE_ENABLED when omitted.
+    :return: The edit decision list that was rendered.
+    """
+    engine = engine or MERGE_ENGINE
+    if engine not in ("fused", "files"):
+        raise ValueError(f"Unknown merge engine: {engine}")
+    # Passed on explicitly, the leg and segment processes do not see changes made to the module setting
+    use_cache = layer_cache.LAYER_CACHE_ENABLED if use_cache is None else use_cache
+    with nullcontext(Path(work_dir)) if work_dir else workspace.workspace() as work_dir:
+        if engine == "fused":
+            return _merge_fused(video_path1,video_path_2,bg_1,bg_2,final_output_path,work_dir,edl,use_cache)
+        return _merge_files(video_path1,video_path_2,bg_1,bg_2,final_output_path,work_dir,edl,use_cache)
+
+
+def _composite_leg(video_path, background_path, output_path, find_silences=True, use_cache=None):
+    put_video_on_background(video_path, background_path, output_path, use_cache=use_cache)
+    return make_video_with_opacity(output_path) if find_silences else None
+
+
+def _leg_pool():
+    if not PARALLEL_LEGS:
+        return nullcontext()
+    # forkserver: the callers have threads (heartbeats, the server), which fork does not mix with
+    return ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("forkserver"))
+
+
+def _both_legs(pool, func, args_1, args_2):
+    """
+    func(*args_1) and func(*args_2), in the pool's processes when there is a pool.
+    The spans recorded in the processes join this thread's recording.
+    """
+    if pool is None:
+        return func(*args_1), func(*args_2)
+    parent = spans.current().name if spans.current() else None
+    futures = [pool.submit(spans.run_recorded, parent, func, *args) for args in (args_1, args_2)]
+    results = []
+    for future in futures:
+        result, recorded = future.result()
+        spans.merge(recorded)
+        results.append(result)
+    return results
+
+
+def _merge_files(video_path1,video_path_2,bg_1,bg_2,final_output_path,work_dir,edl=None,use_cache=None):
+    final_output_path_1 = work_dir / "video_path1.mp4"
+    final_output_path_2 = work_dir / "video_path_2.mp4"
+
+    # The legs only meet at the cutting. Their stages overlap when they run in
+    # parallel, the "legs" span has the wall time of both
+    with spans.span("legs"), _leg_pool() as pool:
+        mask_1, mask_2 = _both_legs(pool, _composite_leg,
+                                    (video_path1, bg_1, final_output_path_1, edl is None, use_cache),
+                                    (video_path_2, bg_2, final_output_path_2, edl is None, use_cache))
+
+    if edl is None:
+        edl = _silence_edl(mask_1, mask_2, video_fps(final_output_path_1))
+    render_edl(edl, final_output_path_1, final_output_path_2, final_output_path)
+    return edl
+
+
+def _merge_fused(video_path1,video_path_2,bg_1,bg_2,final_output_path,work_dir,edl=None,use_cache=None):
+    if edl is None:
+        # The composited legs carry the source audio untouched, so the masks can be
+        # computed straight from the sources
+        mask_1 = make_video_with_opacity(str(video_path1))
+        mask_2 = make_video_with_opacity(str(video_path_2))
+        edl = _silence_edl(mask_1, mask_2, video_fps(video_path1))
+
+    if SEGMENT_PROCESSES != 1:
+        segmented_merge(video_path1,video_path_2,bg_1,bg_2,edl,final_output_path,work_dir,use_cache=use_cache)
+    else:
+        fused_merge(video_path1,video_path_2,bg_1,bg_2,edl,final_output_path,use_cache=use_cache)
+    return edl
+
+
+def _silence_edl(mask_1, mask_2, fps):
     Mask_1,Mask_2 = prune_sandwiched_zeros(mask_1,mask_2)
+    _log_masks(Mask_1,Mask_2)
+    return build_edl(Mask_1, Mask_2, fps)
 
 
-    with open("frames.txt", "a") as fb:
-        fb.write(str(Mask_1.tolist()) + "\n")  # Write as list and add newline
-        fb.write(str(Mask_2.tolist()) + "\n")  # Write as list and add newline
-
-
-
-
-    make_video_with_mask(final_output_path_1,final_output_path_1,Mask_1)
-    make_video_with_mask(final_output_path_2,final_output_path_2,Mask_2)
-
-    merge_videos(final_output_path_1,final_output_path_2,final_output_path)
+def _log_masks(Mask_1,Mask_2):
+    if not MASK_LOG:
+        return
+    # One append of both lines, so concurrent merges never interleave their pairs
+    with open(MASK_LOG, "a") as fb:
+        fb.write(str(Mask_1.tolist()) + "\n" + str(Mask_2.tolist()) + "\n")
@@ -0,0 +1,274 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+# Merge jobs shared between the API servers (which submit and track them) and the
+# render workers (which claim and run them). Point every process at the same file,
+# on shared storage when the workers run on other machines.
+JOB_DB = os.environ.get("JOB_DB", str(Path(__file__).resolve().parent.parent / "merge_jobs.sqlite3"))
+# A running job whose worker has not sent a heartbeat for this long is assumed dead
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "60"))
+# Claims after which a job whose workers keep dying is given up on
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    video1 TEXT NOT NULL,
+    video2 TEXT NOT NULL,
+    background1 TEXT NOT NULL,
+    background2 TEXT NOT NULL,
+    output TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    edl TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_submitted ON jobs (status, submitted_at);
+CREATE TABLE IF NOT EXISTS job_spans (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    parent TEXT,
+    seconds REAL,
+    frames INTEGER,
+    fps REAL,
+    subprocess_seconds REAL,
+    bytes_read INTEGER,
+    bytes_written INTEGER,
+    peak_rss_mb REAL,
+    peak_child_rss_mb REAL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS job_spans_name ON job_spans (name);
+"""
+
+# Columns added after the first release, added to existing databases on connect
+_ADDED_COLUMNS = {"edl": "TEXT"}
+
+_SPAN_COLUMNS = (
+    "name", "parent", "seconds", "frames", "fps", "subprocess_seconds",
+    "bytes_read", "bytes_written", "peak_rss_mb", "peak_child_rss_mb",
+)
+
+_initialized = set()
+
+
+def connect():
+    # Transactions are managed explicitly, claims need BEGIN IMMEDIATE
+    conn = sqlite3.connect(JOB_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if JOB_DB not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        _initialized.add(JOB_DB)
+    return conn
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _job(row):
+    job = dict(row)
+    job["edl"] = json.loads(job["edl"]) if job["edl"] else None
+    if job["started_at"] and job["finished_at"]:
+        job["duration"] = job["finished_at"] - job["started_at"]
+    return job
+
+
+def add_job(video1, video2, background1, background2, output, edl=None):
+    """
+    Queue a merge. All paths must be absolute, workers do not share our working directory.
+
+    :param edl: Edit decision list to render instead of the one found from the silences.
+    :return: The job id.
+    """
+    job_id = uuid.uuid4().hex
+    conn = connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, video1, video2, background1, background2, output, submitted_at, edl) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, str(video1), str(video2), str(background1), str(background2), str(output), time.time(),
+             json.dumps(edl) if edl else None)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+
+def claim(worker=None):
+    """
+    Take the oldest queued job, or a running job whose worker stopped sending
+    heartbeats, and mark it running for this worker.
+
+    :return: The job, None when there is nothing to do.
+    """
+    worker = worker or worker_name()
+    now = time.time()
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (FAILED, "worker stopped responding", now, RUNNING, now - JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND heartbeat_at < ?) "
+                "ORDER BY submitted_at LIMIT 1",
+                (QUEUED, RUNNING, now - JOB_STALE_SECONDS)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, worker, now, now, row["id"])
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return _job(row) if row is not None else None
+
+
+def heartbeat(job_id, worker):
+    """
+    :return: False when the job was taken over by another worker in the meantime.
+    """
+    conn = connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker = ?",
+            (time.time(), job_id, RUNNING, worker)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def finish(job_id, worker, error=None, spans=(), edl=None):
+    """
+    Record the outcome of a job, done when error is None, failed otherwise.
+
+    :param spans: The per-stage spans of the run (see merge_two_videos.spans).
+    :param edl: The edit decision list that was rendered, kept with the job.
+    """
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, edl = COALESCE(?, edl) "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (FAILED if error else DONE, error, time.time(), json.dumps(edl) if edl else None, job_id, RUNNING, worker)
+            )
+            if cursor.rowcount == 1:
+                conn.execute("DELETE FROM job_spans WHERE job_id = ?", (job_id,))
+                conn.executemany(
+                    f"INSERT INTO job_spans (job_id, seq, {', '.join(_SPAN_COLUMNS)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(_SPAN_COLUMNS))})",
+                    [(job_id, seq, *(span[column] for column in _SPAN_COLUMNS)) for seq, span in enumerate(spans)]
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def get_job(job_id):
+    conn = connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        spans = conn.execute(
+            f"SELECT {', '.join(_SPAN_COLUMNS)} FROM job_spans WHERE job_id = ? ORDER BY seq", (job_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {**_job(row), "spans": [dict(span) for span in spans]}
+
+
+def list_jobs(limit=100):
+    conn = connect()
+    try:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY submitted_at DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [_job(row) for row in rows]
+
+
+def counts():
+    conn = connect()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    result = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+    result.update({row["status"]: row["count"] for row in rows})
+    return result
+
+
+def _histogram(conn, value, table, buckets, where="1", params=(), group=None):
+    bucket_sums = ", ".join(f"SUM(CASE WHEN {value} <= ? THEN 1 ELSE 0 END)" for _ in buckets)
+    group_select = f"{group}, " if group else ""
+    query = (
+        f"SELECT {group_select}{bucket_sums}, SUM({value}), COUNT({value}) FROM {table} "
+        f"WHERE {where} AND {value} IS NOT NULL" + (f" GROUP BY {group}" if group else "")
+    )
+    result = {}
+    for row in conn.execute(query, (*buckets, *params)):
+        row = tuple(row)
+        key = row[0] if group else None
+        values = row[1:] if group else row
+        if values[-1]:
+            result[key] = ([count or 0 for count in values[:len(buckets)]], values[-2] or 0.0, values[-1])
+    return result
+
+
+def histograms(buckets):
+    """
+    Cumulative histograms of finished jobs, computed in SQL for the /metrics endpoint.
+
+    :return: dict of name -> {label value: (bucket counts, sum, count)} for
+        "latency" (submitted to finished, by status), "render" (started to finished
+        of done jobs) and "stage" (span seconds, by stage name).
+    """
+    conn = connect()
+    try:
+        return {
+            "latency": _histogram(
+                conn, "finished_at - submitted_at", "jobs", buckets,
+                "status IN (?, ?)", (DONE, FAILED), group="status"
+            ),
+            "render": _histogram(conn, "finished_at - started_at", "jobs", buckets, "status = ?", (DONE,)),
+            "stage": _histogram(conn, "seconds", "job_spans", buckets, group="name"),
+        }
+    finally:
+        conn.close()
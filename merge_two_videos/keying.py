@@ -0,0 +1,200 @@
+import cv2
+import numpy as np
+
+# === Green HSV range for RGB(0,255,0) ===
+LOWER_GREEN = np.array([35, 100, 100])
+UPPER_GREEN = np.array([85, 255, 255])
+
+
+class SubjectTracker:
+    """
+    Finds the bounding box of the green-screen subject frame after frame.
+
+    Contours are searched on a downscaled mask, and between full detections only a
+    window around the previous box is looked at. While the subject moves less than
+    move_threshold pixels the previous box is reused, which also removes jitter.
+    A full re-detection runs on larger moves and every redetect_every frames.
+
+    :param lower_green: Lower HSV bound of the key color.
+    :param upper_green: Upper HSV bound of the key color.
+    :param detect_scale: Scale of the mask contours are searched on.
+    :param move_threshold: Largest change of the box (in pixels) that is ignored.
+    :param redetect_every: Frames between forced full detections.
+    :param margin: Pixels around the previous box searched while tracking.
+    """
+
+    def __init__(self, lower_green=LOWER_GREEN, upper_green=UPPER_GREEN, detect_scale=0.25,
+                 move_threshold=8, redetect_every=30, margin=32):
+        self.lower_green = lower_green
+        self.upper_green = upper_green
+        self.detect_scale = detect_scale
+        self.move_threshold = move_threshold
+        self.redetect_every = redetect_every
+        self.margin = margin
+        self.bbox = None
+        self.frames_since_detect = 0
+
+    def locate(self, frame):
+        """
+        :return: (x, y, w, h) of the subject in frame, or None if there is none.
+        """
+        if self.bbox is None or self.frames_since_detect >= self.redetect_every:
+            return self._detect(frame)
+
+        frame_height, frame_width = frame.shape[:2]
+        x, y, w, h = self.bbox
+        left, top = max(x - self.margin, 0), max(y - self.margin, 0)
+        right, bottom = min(x + w + self.margin, frame_width), min(y + h + self.margin, frame_height)
+
+        found = self._largest_box(frame[top:bottom, left:right])
+        if found is None:
+            return self._detect(frame)
+        fx, fy, fw, fh = found
+        # The subject reaches the edge of the window, it may extend past it
+        touches_edge = (
+            (fx == 0 and left > 0) or (fy == 0 and top > 0)
+            or (fx + fw >= right - left and right < frame_width)
+            or (fy + fh >= bottom - top and bottom < frame_height)
+        )
+        moved = max(abs(left + fx - x), abs(top + fy - y),
+                    abs(left + fx + fw - x - w), abs(top + fy + fh - y - h))
+        if touches_edge or moved > self.move_threshold:
+            return self._detect(frame)
+
+        self.frames_since_detect += 1
+        return self.bbox
+
+    def _detect(self, frame):
+        self.frames_since_detect = 1
+        self.bbox = None
+        found = self._largest_box(frame)
+        if found is None:
+            return None
+
+        # Refine the coarse box on the full-resolution mask
+        frame_height, frame_width = frame.shape[:2]
+        pad = int(np.ceil(1 / self.detect_scale))
+        x, y, w, h = found
+        left, top = max(x - pad, 0), max(y - pad, 0)
+        right, bottom = min(x + w + pad, frame_width), min(y + h + pad, frame_height)
+        mask_inv = _subject_mask(frame[top:bottom, left:right], self.lower_green, self.upper_green)
+        rx, ry, rw, rh = cv2.boundingRect(mask_inv)
+        if rw == 0 or rh == 0:
+            return None
+
+        self.bbox = (left + rx, top + ry, rw, rh)
+        return self.bbox
+
+    def _largest_box(self, region):
+        """
+        Bounding box of the largest subject contour in region, searched on a downscaled
+        mask and mapped back to region coordinates (may be off by a few pixels).
+        """
+        small = cv2.resize(region, None, fx=self.detect_scale, fy=self.detect_scale,
+                           interpolation=cv2.INTER_NEAREST)
+        if small.size == 0:
+            return None
+        mask_inv = _subject_mask(small, self.lower_green, self.upper_green)
+        contours, _ = cv2.findContours(mask_inv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+
+        largest = max(contours, key=cv2.contourArea)
+        x, y, w, h = cv2.boundingRect(largest)
+        region_height, region_width = region.shape[:2]
+        left = int(x / self.detect_scale)
+        top = int(y / self.detect_scale)
+        right = min(int(np.ceil((x + w) / self.detect_scale)), region_width)
+        bottom = min(int(np.ceil((y + h) / self.detect_scale)), region_height)
+        return left, top, right - left, bottom - top
+
+
+def _subject_mask(frame, lower_green, upper_green):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, lower_green, upper_green)
+    return cv2.bitwise_not(mask)
+
+
+def _scale_subject(bbox, subject, mask_crop, scale_factor):
+    h, w = subject.shape[:2]
+
+    # Resize subject and mask
+    new_w = int(w * scale_factor)
+    new_h = int(h * scale_factor)
+    subject_resized = cv2.resize(subject, (new_w, new_h))
+    mask_resized = cv2.resize(mask_crop, (new_w, new_h))
+    return bbox, subject_resized, mask_resized
+
+
+def key_subject(frame, lower_green=LOWER_GREEN, upper_green=UPPER_GREEN, scale_factor=0.6, tracker=None):
+    """
+    Key the green screen out of a single frame and scale the largest subject.
+
+    :param frame: BGR frame from the green-screen video.
+    :param lower_green: Lower HSV bound of the key color.
+    :param upper_green: Upper HSV bound of the key color.
+    :param scale_factor: Factor by which to scale the subject.
+    :param tracker: SubjectTracker to locate the subject with; without one every
+        frame gets a full-resolution contour search.
+    :return: The keyed layer (bbox, scaled subject, scaled alpha mask), or None
+        if the frame has no subject.
+    """
+    if tracker is not None:
+        return key_subject_at(frame, tracker.locate(frame), lower_green, upper_green, scale_factor)
+
+    mask_inv = _subject_mask(frame, lower_green, upper_green)
+
+    contours, _ = cv2.findContours(mask_inv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    largest = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(largest)
+
+    subject = frame[y:y+h, x:x+w]
+    mask_crop = mask_inv[y:y+h, x:x+w]
+    return _scale_subject((x, y, w, h), subject, mask_crop, scale_factor)
+
+
+def key_subject_at(frame, bbox, lower_green=LOWER_GREEN, upper_green=UPPER_GREEN, scale_factor=0.6):
+    """
+    Same as key_subject for a subject whose bounding box is already known.
+    Only the pixels inside bbox are keyed.
+    """
+    if bbox is None:
+        return None
+
+    x, y, w, h = bbox
+    subject = frame[y:y+h, x:x+w]
+    mask_crop = _subject_mask(subject, lower_green, upper_green)
+    return _scale_subject(bbox, subject, mask_crop, scale_factor)
+
+
+def paste_layer(bg_image, layer):
+    """
+    Center a keyed layer on a copy of the background.
+
+    :param bg_image: BGR background image the subject is placed on.
+    :param layer: Keyed layer from key_subject, or None for an empty frame.
+    :return: The composited BGR frame, the same size as the background.
+    """
+    result = bg_image.copy()
+    if layer is None:
+        return result
+
+    _, subject_resized, mask_resized = layer
+    bg_height, bg_width = result.shape[:2]
+    new_h, new_w = subject_resized.shape[:2]
+
+    # Center position on background
+    cx = (bg_width - new_w) // 2
+    cy = (bg_height - new_h) // 2
+
+    roi = result[cy:cy+new_h, cx:cx+new_w]
+    mask_inv_resized = cv2.bitwise_not(mask_resized)
+
+    bg_part = cv2.bitwise_and(roi, roi, mask=mask_inv_resized)
+    fg_part = cv2.bitwise_and(subject_resized, subject_resized, mask=mask_resized)
+    result[cy:cy+new_h, cx:cx+new_w] = cv2.add(bg_part, fg_part)
+    return result
+
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import uuid
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import media_index
+from merge_two_videos import spans
+from merge_two_videos.keying import key_subject, key_subject_at, SubjectTracker, LOWER_GREEN, UPPER_GREEN
+
+# === Keyed subject layers, cached per (video content, scale_factor, HSV range, tracking) ===
+LAYER_CACHE_DIR = Path(os.environ.get("LAYER_CACHE_DIR", Path(__file__).resolve().parent.parent / "layer_cache"))
+LAYER_CACHE_MAX_BYTES = int(os.environ.get("LAYER_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+LAYER_CACHE_ENABLED = os.environ.get("LAYER_CACHE", "1") == "1"
+
+# Per frame: x, y, w, h of the subject in the source frame, then the length of the
+# PNG (BGRA, alpha = mask) holding the scaled subject. w == 0 means no subject.
+_RECORD = struct.Struct("<iiiiI")
+_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def video_sha256(video_path):
+    """
+    Content hash of a video: the one recorded at upload when there is one, otherwise
+    the file is hashed.
+    """
+    return media_index.recorded_sha256(video_path) or file_sha256(video_path)
+
+
+def layer_key(video_path, scale_factor, lower_green, upper_green, tracking):
+    params = json.dumps({
+        "video": video_sha256(video_path),
+        "scale_factor": scale_factor,
+        "lower_green": [int(v) for v in lower_green],
+        "upper_green": [int(v) for v in upper_green],
+        "tracking": bool(tracking),
+    }, sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+class KeyedLayers:
+    """
+    Reads the keyed layers (see key_subject) of a green-screen video frame by frame.
+
+    The layers come from the cache when this video was keyed before with the same
+    settings. Otherwise the video is decoded and keyed, and the layers are written
+    to a new cache entry that is published when the reader is closed.
+
+    :param video_path: Path to the green-screen video.
+    :param scale_factor: Factor by which to scale the subject.
+    :param lower_green: Lower HSV bound of the key color.
+    :param upper_green: Upper HSV bound of the key color.
+    :param tracking: Track the subject between frames (see SubjectTracker).
+    :param use_cache: Read and write the layer cache, LAYER_CACHE_ENABLED when omitted.
+    :param start_frame: First frame to read. Readers that start past 0 only read the
+        cache, an entry must cover the whole video.
+    :param write_cache: False to only read the cache (e.g. when other processes read
+        the rest of the video).
+    """
+
+    def __init__(self, video_path, scale_factor=0.6, lower_green=LOWER_GREEN, upper_green=UPPER_GREEN,
+                 tracking=True, use_cache=None, start_frame=0, write_cache=True):
+        self.video_path = str(video_path)
+        self.scale_factor = scale_factor
+        self.lower_green = lower_green
+        self.upper_green = upper_green
+        self.tracker = SubjectTracker(lower_green, upper_green) if tracking else None
+        self.use_cache = LAYER_CACHE_ENABLED if use_cache is None else use_cache
+        self.cached = False
+        self.frames_read = 0
+        self._cap = None
+        self._layers_file = None
+        self._temp_dir = None
+        self._finished = False
+
+        self.key = layer_key(video_path, scale_factor, lower_green, upper_green, tracking) if self.use_cache else None
+        self.entry = LAYER_CACHE_DIR / self.key if self.key else None
+
+        if self.entry is not None and (self.entry / "meta.json").exists():
+            try:
+                meta = json.loads((self.entry / "meta.json").read_text())
+                self._layers_file = open(self.entry / "layers.bin", "rb")
+            except (OSError, ValueError):
+                pass  # evicted or half-removed, key it again
+            else:
+                os.utime(self.entry / "meta.json")  # last use, for LRU eviction
+                spans.add(bytes_read=os.path.getsize(self.entry / "layers.bin"))
+                self.cached = True
+                self.fps = meta["fps"]
+                for _ in range(start_frame):
+                    self._read_cached(wanted=False)
+                return
+
+        self._cap = cv2.VideoCapture(self.video_path)
+        spans.add(bytes_read=os.path.getsize(self.video_path))
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        if self.fps == 0:
+            self.fps = 30  # fallback fps if cannot read
+        if start_frame:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        if self.entry is not None and write_cache and not start_frame:
+            LAYER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            self._temp_dir = LAYER_CACHE_DIR / f".tmp-{self.key}-{uuid.uuid4().hex}"
+            self._temp_dir.mkdir()
+            self._layers_file = open(self._temp_dir / "layers.bin", "wb")
+
+    def read(self, wanted=True):
+        """
+        Read the layer of the next frame, like cv2.VideoCapture.read.
+
+        :param wanted: False when the caller will not use the layer, so keying can be
+            skipped unless a cache entry is being written.
+        :return: (ok, layer) where layer is None for a frame without a subject.
+        """
+        if self.cached:
+            ok, layer = self._read_cached(wanted)
+        else:
+            ok, layer = self._read_keyed(wanted)
+        if ok:
+            self.frames_read += 1
+        else:
+            self._finished = True
+        return ok, layer
+
+    def read_deferred(self, wanted=True):
+        """
+        Same as read, but the expensive part of getting a layer is left to the caller:
+        the returned function does it and can run on another thread (see frame_pipeline).
+        Decoded frames are only located here, the tracker must see them in order, and
+        cached layers are only read, not decoded.
+
+        :return: (ok, key) where key() returns the layer.
+        """
+        if self.cached:
+            ok, record = self._read_record(wanted)
+            key = lambda: _decode_record(record)
+        elif self._temp_dir is not None or not wanted:
+            # Cache entries are written in frame order, those layers are keyed right away
+            ok, layer = self._read_keyed(wanted)
+            key = lambda: layer
+        else:
+            ok, frame = self._cap.read()
+            if self.tracker is None:
+                key = lambda: key_subject(frame, self.lower_green, self.upper_green, self.scale_factor)
+            else:
+                bbox = self.tracker.locate(frame) if ok else None
+                key = lambda: key_subject_at(frame, bbox, self.lower_green, self.upper_green, self.scale_factor)
+
+        if ok:
+            self.frames_read += 1
+        else:
+            self._finished = True
+        return ok, key
+
+    def _read_cached(self, wanted):
+        ok, record = self._read_record(wanted)
+        return ok, _decode_record(record)
+
+    def _read_record(self, wanted):
+        """
+        :return: (ok, (bbox, PNG bytes)), the record is None for a frame without a
+            subject or one that is not wanted.
+        """
+        header = self._layers_file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return False, None
+        x, y, w, h, length = _RECORD.unpack(header)
+        if not wanted:
+            self._layers_file.seek(length, os.SEEK_CUR)
+            return True, None
+        if w == 0:
+            return True, None
+        return True, ((x, y, w, h), self._layers_file.read(length))
+
+    def _read_keyed(self, wanted):
+        writing = self._temp_dir is not None
+        if not (wanted or writing or self.tracker):
+            return self._cap.grab(), None
+
+        ret, frame = self._cap.read()
+        if not ret:
+            return False, None
+        if not (wanted or writing):
+            # Keep the tracker in step without keying the frame
+            self.tracker.locate(frame)
+            return True, None
+
+        layer = key_subject(frame, self.lower_green, self.upper_green, self.scale_factor, self.tracker)
+        if writing:
+            self._write_layer(layer)
+        return True, layer
+
+    def _write_layer(self, layer):
+        if layer is None:
+            self._layers_file.write(_RECORD.pack(0, 0, 0, 0, 0))
+            return
+        (x, y, w, h), subject, mask = layer
+        # Pixels outside the mask are never shown, zeroing them keeps the PNG small
+        bgra = cv2.merge([*cv2.split(cv2.bitwise_and(subject, subject, mask=mask)), mask])
+        png = cv2.imencode(".png", bgra, _PNG_PARAMS)[1]
+        self._layers_file.write(_RECORD.pack(x, y, w, h, len(png)))
+        self._layers_file.write(png.tobytes())
+
+    def close(self):
+        if self._temp_dir is not None:
+            # The entry must cover the whole video, key what the caller did not read
+            while not self._finished:
+                self.read()
+            self._layers_file.close()
+            (self._temp_dir / "meta.json").write_text(json.dumps({
+                "video": self.video_path,
+                "fps": self.fps,
+                "frame_count": self.frames_read,
+                "scale_factor": self.scale_factor,
+            }))
+            try:
+                os.replace(self._temp_dir, self.entry)
+            except OSError:
+                # Another merge published the same entry first
+                shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+            evict(LAYER_CACHE_MAX_BYTES, keep=self.key)
+        self._release()
+
+    def abort(self):
+        if self._temp_dir is not None:
+            self._layers_file.close()
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+        self._release()
+
+    def _release(self):
+        if self._layers_file is not None and not self._layers_file.closed:
+            self._layers_file.close()
+        if self._cap is not None:
+            self._cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _decode_record(record):
+    if record is None:
+        return None
+    (x, y, w, h), png = record
+    bgra = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    return (x, y, w, h), bgra[:, :, :3], bgra[:, :, 3]
+
+
+def evict(max_bytes=LAYER_CACHE_MAX_BYTES, keep=None):
+    """
+    Remove the least recently used cache entries until the cache fits in max_bytes.
+    """
+    if not LAYER_CACHE_DIR.exists():
+        return
+    entries = []
+    for entry in LAYER_CACHE_DIR.iterdir():
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        try:
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            last_used = (entry / "meta.json").stat().st_mtime
+        except OSError:
+            continue
+        entries.append((last_used, size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry.name == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
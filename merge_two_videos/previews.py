@@ -0,0 +1,116 @@
+"""
+Poster frames and short low-resolution preview clips of merged videos, so the
+listings do not have to open the full outputs.
+
+For <merged dir>/<name>.mp4 they are <merged dir>/previews/<name>.jpg and
+<merged dir>/previews/<name>.mp4. Outputs rendered by the workers get them right
+away; for older outputs run
+
+    python -m merge_two_videos.previews [merged dir]
+"""
+import argparse
+import os
+import subprocess
+from pathlib import Path
+
+import cv2
+
+import media_index
+
+PREVIEW_DIR_NAME = "previews"
+PREVIEW_WIDTH = int(os.environ.get("PREVIEW_WIDTH", "320"))
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", "4"))
+PREVIEW_FPS = 15
+
+
+def preview_paths(output_path):
+    """
+    :return: (poster path, preview clip path) of a merged video.
+    """
+    output_path = Path(output_path)
+    preview_dir = output_path.parent / PREVIEW_DIR_NAME
+    return preview_dir / f"{output_path.stem}.jpg", preview_dir / f"{output_path.stem}.mp4"
+
+
+def _duration(video_path):
+    cap = cv2.VideoCapture(str(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    return frame_count / fps if frame_count > 0 else 0.0
+
+
+def _ffmpeg_to(path, args):
+    # Written next to the destination and renamed, readers never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.stem}.{os.getpid()}{path.suffix}")
+    try:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", *args, str(temp_path)], check=True)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def make_poster(video_path, poster_path, at=None, width=PREVIEW_WIDTH):
+    """
+    Save the frame at `at` seconds (a tenth into the video by default) as a JPEG.
+    """
+    if at is None:
+        at = _duration(video_path) * 0.1
+    _ffmpeg_to(Path(poster_path), [
+        "-ss", f"{at:.3f}", "-i", str(video_path),
+        "-frames:v", "1", "-vf", f"scale={width}:-2", "-q:v", "4",
+    ])
+
+
+def make_preview_clip(video_path, clip_path, start=None, seconds=PREVIEW_SECONDS, width=PREVIEW_WIDTH):
+    """
+    Save a short, silent, low-resolution clip (from a tenth into the video by default).
+    """
+    duration = _duration(video_path)
+    if start is None:
+        start = max(min(duration * 0.1, duration - seconds), 0)
+    _ffmpeg_to(Path(clip_path), [
+        "-ss", f"{start:.3f}", "-t", f"{seconds:.3f}", "-i", str(video_path),
+        "-an", "-vf", f"scale={width}:-2,fps={PREVIEW_FPS}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast", "-crf", "30",
+        "-movflags", "+faststart",
+    ])
+
+
+def make_previews(video_path, output_path=None):
+    """
+    Make the poster and preview clip of a merged video.
+
+    :param video_path: The rendered video to read.
+    :param output_path: Where the video is (or will be) published, decides where the
+        previews go. Defaults to video_path.
+    :return: (poster path, preview clip path)
+    """
+    poster_path, clip_path = preview_paths(output_path or video_path)
+    make_poster(video_path, poster_path)
+    make_preview_clip(video_path, clip_path)
+    return poster_path, clip_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("merged_dir", nargs="?", default="merged")
+    parser.add_argument("--force", action="store_true", help="remake existing previews")
+    args = parser.parse_args()
+
+    for output_path in sorted(Path(args.merged_dir).glob("*.mp4")):
+        poster_path, clip_path = preview_paths(output_path)
+        if args.force or not (poster_path.exists() and clip_path.exists()):
+            make_previews(output_path)
+            print(f"🖼️ {output_path.name}")
+        media_index.add_media(
+            media_index.MERGED, output_path,
+            poster=poster_path.relative_to(output_path.parent).as_posix(),
+            preview=clip_path.relative_to(output_path.parent).as_posix(),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from merge_two_videos import layer_cache, spans
+from merge_two_videos.backgrounds import load_background
+from merge_two_videos.edl import AUDIO_MIX, audio_mix, frame_sources
+from merge_two_videos.frame_sink import ENCODER_SETTINGS, FrameSink
+from merge_two_videos.fused import fused_merge, render_frames
+from merge_two_videos.layer_cache import KeyedLayers
+
+# === Segment-parallel rendering of long merges ===
+#
+# The timeline is cut into segments that start on the keyframe grid of the output
+# (ENCODER_SETTINGS["keyframe_seconds"]), every segment is rendered (video only) in
+# its own process next to the mixed audio, then the segments and the audio are
+# joined with the concat demuxer without re-encoding.
+
+# Processes a single merge renders with: 1 renders in one pass, 0 uses every core
+SEGMENT_PROCESSES = int(os.environ.get("MERGE_SEGMENT_PROCESSES", "1"))
+# Shortest segment worth a process of its own, short clips are rendered in one pass
+SEGMENT_MIN_SECONDS = float(os.environ.get("MERGE_SEGMENT_MIN_SECONDS", "10"))
+
+
+def segment_count(frame_count, fps, processes=None):
+    processes = SEGMENT_PROCESSES if processes is None else processes
+    processes = processes or os.cpu_count() or 1
+    return max(1, min(processes, int(frame_count / fps // SEGMENT_MIN_SECONDS)))
+
+
+def segment_bounds(frame_count, fps, segments, keyframe_seconds=None):
+    """
+    Split frames [0, frame_count) into at most `segments` (start, end) ranges of
+    about the same length, each starting on the keyframe grid so the joined video
+    keeps a keyframe every keyframe_seconds.
+    """
+    if keyframe_seconds is None:
+        keyframe_seconds = ENCODER_SETTINGS["keyframe_seconds"]
+    grid = max(int(round(keyframe_seconds * fps)), 1) if keyframe_seconds else 1
+    starts = sorted({int(round(frame_count * i / segments / grid)) * grid for i in range(segments)})
+    starts = [start for start in starts if start < frame_count]
+    return list(zip(starts, starts[1:] + [frame_count]))
+
+
+@spans.stage("segment")
+def render_segment(video1_path, video2_path, bg_1, bg_2, sources, start_frame, output,
+                   scale_factor=0.6, tracking=True, use_cache=None):
+    """
+    Render the frames from start_frame on of a fused merge (see fused_merge) into a
+    video without audio.
+
+    :param sources: The sources of the frames of the segment (see frame_sources).
+    """
+    bg_image_1 = load_background(bg_1)
+    bg_image_2 = load_background(bg_2)
+    frame_height, frame_width = bg_image_1.shape[:2]
+
+    # Segments that start mid-video cannot write a layer cache entry, so none of them does
+    layers1 = KeyedLayers(video1_path, scale_factor, tracking=tracking, use_cache=use_cache,
+                          start_frame=start_frame, write_cache=False)
+    layers2 = KeyedLayers(video2_path, scale_factor, tracking=tracking, use_cache=use_cache,
+                          start_frame=start_frame, write_cache=False)
+    with layers1, layers2, FrameSink(output, frame_width, frame_height, layers1.fps, faststart=False) as out:
+        # The segments already keep the cores busy, one compute thread each overlaps decode and encode
+        render_frames(out, layers1, layers2, bg_image_1, bg_image_2, sources, threads=1)
+
+
+@spans.stage("audio")
+def mix_audio(audio_inputs, output, mix=AUDIO_MIX):
+    """
+    Encode the mixed audio of the inputs on its own, rendered alongside the segments.
+
+    :param mix: Filter over the audio of both inputs (see audio_mix).
+    """
+    cmd = ["ffmpeg", "-y", "-loglevel", "error"]
+    for audio_input in audio_inputs:
+        cmd += ["-i", str(audio_input)]
+    cmd += ["-filter_complex", f"[0:a][1:a]{mix}[aout]", "-map", "[aout]", "-c:a", ENCODER_SETTINGS["audio_codec"], str(output)]
+
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    spans.add(bytes_written=os.path.getsize(output), subprocess_seconds=time.perf_counter() - started)
+
+
+@spans.stage("concat")
+def concat_segments(segment_paths, audio_path, final_output, list_path):
+    """
+    Join the segments with the concat demuxer and mux the audio, both copied, nothing
+    is re-encoded.
+    """
+    list_path = Path(list_path)
+    list_path.write_text("".join(f"file '{Path(path).resolve().as_posix()}'\n" for path in segment_paths))
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_path),
+        "-i", str(audio_path), "-map", "0:v", "-map", "1:a", "-c", "copy",
+    ]
+    if ENCODER_SETTINGS["faststart"]:
+        cmd += ["-movflags", "+faststart"]
+    cmd.append(str(final_output))
+
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    spans.add(bytes_written=os.path.getsize(final_output), subprocess_seconds=time.perf_counter() - started)
+
+
+def segmented_merge(video1_path, video2_path, bg_1, bg_2, edl, final_output, work_dir,
+                    processes=None, scale_factor=0.6, tracking=True, use_cache=None):
+    """
+    fused_merge with the timeline split across processes, for long takes. Falls back
+    to fused_merge when the clip is too short for more than one segment.
+
+    :param work_dir: Directory for the segment files.
+    :param processes: Processes to render with, SEGMENT_PROCESSES when omitted.
+    :param use_cache: Read the layer cache, LAYER_CACHE_ENABLED when omitted.
+    """
+    # Decided here, the segment processes do not see changes made to the module setting
+    use_cache = layer_cache.LAYER_CACHE_ENABLED if use_cache is None else use_cache
+    fps = edl["fps"]
+    bounds = segment_bounds(edl["frames"], fps, segment_count(edl["frames"], fps, processes))
+    if len(bounds) < 2:
+        return fused_merge(video1_path, video2_path, bg_1, bg_2, edl, final_output, scale_factor, tracking, use_cache)
+
+    with spans.span("render"):
+        print(f"🎞️ Rendering merged video in {len(bounds)} segments...")
+        work_dir = Path(work_dir)
+        segment_paths = [work_dir / f"segment_{i:05d}.mp4" for i in range(len(bounds))]
+        audio_path = work_dir / "audio.m4a"
+        # forkserver: the callers have threads (heartbeats, the server), which fork does not mix with
+        with ProcessPoolExecutor(max_workers=len(bounds), mp_context=multiprocessing.get_context("forkserver")) as pool:
+            futures = [pool.submit(spans.run_recorded, "render", mix_audio, [video1_path, video2_path], audio_path,
+                                   audio_mix(edl))]
+            futures += [
+                pool.submit(spans.run_recorded, "render", render_segment, video1_path, video2_path, bg_1, bg_2,
+                            frame_sources(edl, start, end), start, path, scale_factor, tracking, use_cache)
+                for (start, end), path in zip(bounds, segment_paths)
+            ]
+            for future in futures:
+                spans.merge(future.result()[1])
+
+        concat_segments(segment_paths, audio_path, final_output, work_dir / "segments.txt")
+
+    print("✅ Merged video saved at:", final_output)
@@ -0,0 +1,111 @@
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+from merge_two_videos import spans
+
+# PCM format requested from ffmpeg for the analysis
+ANALYSIS_SAMPLE_RATE = 44100
+ANALYSIS_CHANNELS = 2
+MAX_AMPLITUDE = 32768  # 16-bit signed PCM
+
+SILENCE_THRESHOLD = -70  # dBFS
+SILENT_DBFS = -100.0  # volume reported for digital silence
+
+
+def video_fps(video_path, fallback=30):
+    cap = cv2.VideoCapture(str(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps and fps > 0 else fallback
+
+
+def frame_volumes(video_path, fps=None, sample_rate=ANALYSIS_SAMPLE_RATE, chunk_seconds=5):
+    """
+    Stream the audio of a video from an ffmpeg pipe and compute the volume (dBFS)
+    of every video frame. Window i covers the samples between the timestamps of
+    frame i and frame i + 1, so the result lines up with the decoded frames.
+
+    :param video_path: Path to the video file.
+    :param fps: Frame rate to align to, read from the container when omitted.
+    :param sample_rate: Sample rate the audio is decoded at.
+    :param chunk_seconds: Seconds of audio held in memory at a time.
+    :return: float array with one dBFS value per frame.
+    """
+    fps = fps or video_fps(video_path)
+    channels = ANALYSIS_CHANNELS
+
+    def boundary(frame_idx):
+        # First sample (per channel) of the given frame
+        return np.rint(np.asarray(frame_idx) * sample_rate / fps).astype(np.int64)
+
+    started = time.perf_counter()
+    bytes_read = 0
+    process = subprocess.Popen([
+        "ffmpeg", "-loglevel", "error", "-i", str(video_path),
+        "-vn", "-ac", str(channels), "-ar", str(sample_rate),
+        "-f", "s16le", "-"
+    ], stdout=subprocess.PIPE)
+
+    chunk_bytes = int(sample_rate * chunk_seconds) * channels * 2
+    volumes = []
+    buffer = np.empty(0, dtype=np.float64)  # per-sample energy summed over channels
+    consumed = 0  # samples that came before the start of buffer
+    frame_idx = 0
+
+    while True:
+        data = process.stdout.read(chunk_bytes)
+        bytes_read += len(data)
+        if data:
+            samples = np.frombuffer(data, dtype="<i2")
+            samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+            energy = np.square(samples, dtype=np.float64).sum(axis=1)
+            buffer = np.concatenate([buffer, energy])
+
+        available = consumed + len(buffer)
+        last_frame = int(available * fps / sample_rate)
+        if data:
+            # Frames whose window is complete
+            while boundary(last_frame + 1) <= available:
+                last_frame += 1
+            while last_frame > frame_idx and boundary(last_frame) > available:
+                last_frame -= 1
+        else:
+            # Flush, including a trailing partial window
+            while boundary(last_frame) < available:
+                last_frame += 1
+
+        if last_frame > frame_idx:
+            edges = np.minimum(boundary(np.arange(frame_idx, last_frame + 1)), available) - consumed
+            sums = np.add.reduceat(buffer[:edges[-1]], edges[:-1])
+            counts = np.diff(edges) * channels
+            # Floor the RMS like pydub's AudioSegment.rms did
+            rms = np.floor(np.sqrt(sums / counts))
+            with np.errstate(divide="ignore"):
+                dbfs = 20 * np.log10(rms / MAX_AMPLITUDE)
+            dbfs[rms == 0] = SILENT_DBFS
+            volumes.append(dbfs)
+
+            buffer = buffer[edges[-1]:]
+            consumed += edges[-1]
+            frame_idx = last_frame
+
+        if not data:
+            break
+
+    process.stdout.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+    spans.add(frames=frame_idx, bytes_read=bytes_read, subprocess_seconds=time.perf_counter() - started)
+
+    return np.concatenate(volumes) if volumes else np.empty(0)
+
+
+def silent_frame_mask(video_path, fps=None, silence_threshold=SILENCE_THRESHOLD):
+    """
+    :return: uint8 array with 1 for every frame whose audio is below silence_threshold.
+    """
+    volumes = frame_volumes(video_path, fps=fps)
+    return (volumes < silence_threshold).astype(np.uint8)
@@ -0,0 +1,136 @@
+import functools
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# === Per-stage timing of the merge pipeline ===
+#
+# Stages run inside `with span("name") as s:` and count their work on the span
+# (frames, bytes, time spent in subprocesses). Finished spans are collected by the
+# innermost `with recording() as spans:` of the thread, the worker records one per job.
+
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.frames = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.subprocess_seconds = 0.0
+        self.seconds = None
+        self.peak_rss_mb = None
+        self.peak_child_rss_mb = None
+
+    def add(self, frames=0, bytes_read=0, bytes_written=0, subprocess_seconds=0.0):
+        self.frames += frames
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        self.subprocess_seconds += subprocess_seconds
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "seconds": self.seconds,
+            "frames": self.frames,
+            "fps": self.frames / self.seconds if self.frames and self.seconds else None,
+            "subprocess_seconds": self.subprocess_seconds,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_child_rss_mb": self.peak_child_rss_mb,
+        }
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def current():
+    """
+    The innermost open span of this thread, None outside of any span.
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def add(**counts):
+    """
+    Count work on the current span, if there is one. See Span.add.
+    """
+    span_ = current()
+    if span_ is not None:
+        span_.add(**counts)
+
+
+@contextmanager
+def span(name):
+    stack = _stack()
+    span_ = Span(name, stack[-1].name if stack else None)
+    stack.append(span_)
+    start = time.perf_counter()
+    try:
+        yield span_
+    finally:
+        span_.seconds = time.perf_counter() - start
+        # ru_maxrss is in KiB on Linux; peaks since process start, not per span
+        span_.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        span_.peak_child_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        stack.pop()
+        recorder = getattr(_local, "recorder", None)
+        if recorder is not None:
+            recorder.append(span_.as_dict())
+
+
+def stage(name):
+    """
+    Decorator running the whole function in a span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def recording():
+    """
+    Collect the spans finished in this thread while the block runs, in the order
+    they finished (children before their parent).
+    """
+    previous = getattr(_local, "recorder", None)
+    _local.recorder = []
+    try:
+        yield _local.recorder
+    finally:
+        _local.recorder = previous
+
+
+def run_recorded(parent, func, *args):
+    """
+    Run func with a clean span stack, as if inside a span named parent, and return
+    (result, recorded spans). For work handed to another process: the caller passes
+    the spans to merge().
+    """
+    _local.stack = [Span(parent)] if parent else []
+    with recording() as recorded:
+        result = func(*args)
+    return result, recorded
+
+
+def merge(recorded):
+    """
+    Add spans recorded elsewhere (see run_recorded) to the innermost recording of this thread.
+    """
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None:
+        recorder.extend(recorded)
@@ -0,0 +1,135 @@
+"""
+Render worker: claims merge jobs from the job store and runs them one at a time.
+
+Start as many as the machine has cores for, on as many machines as share the job
+store, the upload directory and the merged directory:
+
+    python -m merge_two_videos.worker [--once] [--poll SECONDS] [--scratch-dir DIR]
+
+SIGTERM lets the current job finish before the worker exits.
+"""
+import argparse
+import os
+import shutil
+import signal
+import threading
+import traceback
+from pathlib import Path
+
+import media_index
+from merge_two_videos import job_store, spans, workspace
+from merge_two_videos.index import merge_two_videos_into_one
+from merge_two_videos.previews import make_previews
+from merge_two_videos.hls import HLS_ENABLED, hls_dir, package_hls
+
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "10"))
+WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", "1"))
+
+_stop = threading.Event()
+
+
+def publish(rendered_path, output_path):
+    """
+    Move a finished render to output_path so that readers never see a partial file:
+    it is first brought next to the destination, then renamed over it.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.part")
+    try:
+        os.replace(rendered_path, temp_path)
+    except OSError:
+        # Scratch space is on another filesystem
+        shutil.copyfile(rendered_path, temp_path)
+    os.replace(temp_path, output_path)
+
+
+def _heartbeat(job, worker, done, lost):
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        if not job_store.heartbeat(job["id"], worker):
+            lost.set()
+            return
+
+
+def run_job(job, worker, scratch_root=None):
+    """
+    Render a claimed job in its own workspace and publish the output.
+
+    :param scratch_root: Where the workspace is created, see workspace.default_root.
+    """
+    done = threading.Event()
+    lost = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job, worker, done, lost), daemon=True)
+    beat.start()
+
+    recorded = []
+    try:
+        with workspace.workspace(f"merge_{job['id']}_", scratch_root) as work_dir, \
+                spans.recording() as recorded, spans.span("job"):
+            rendered_path = work_dir / "output.mp4"
+            edl = merge_two_videos_into_one(job["video1"], job["video2"], job["background1"], job["background2"],
+                                            rendered_path, work_dir=work_dir, edl=job["edl"])
+            if lost.is_set():
+                print(f"⚠️ Job {job['id']} was taken over by another worker, dropping the render")
+                return
+            # Previews first, so the output never shows up in a listing without them
+            with spans.span("previews"):
+                poster_path, clip_path = make_previews(rendered_path, job["output"])
+            playlist = None
+            if HLS_ENABLED:
+                with spans.span("hls"):
+                    playlist = package_hls(rendered_path, hls_dir(job["output"]))
+            with spans.span("publish"):
+                publish(rendered_path, job["output"])
+            output_dir = Path(job["output"]).parent
+            media_index.add_media(
+                media_index.MERGED, job["output"], video1=job["video1"], video2=job["video2"],
+                poster=poster_path.relative_to(output_dir).as_posix(),
+                preview=clip_path.relative_to(output_dir).as_posix(),
+                hls=playlist.relative_to(output_dir).as_posix() if playlist else None,
+            )
+        job_store.finish(job["id"], worker, spans=recorded, edl=edl)
+        print(f"✅ Job {job['id']} done: {job['output']}")
+    except Exception as e:
+        traceback.print_exc()
+        job_store.finish(job["id"], worker, error=str(e) or type(e).__name__, spans=recorded)
+        print(f"❌ Job {job['id']} failed: {e}")
+    finally:
+        done.set()
+
+
+def run(once=False, poll=WORKER_POLL_SECONDS, scratch_root=None):
+    """
+    Claim and run jobs until stopped (or, with once, until the queue is empty).
+    """
+    worker = job_store.worker_name()
+    print(f"👷 Worker {worker} polling {job_store.JOB_DB}")
+    while not _stop.is_set():
+        job = job_store.claim(worker)
+        if job is None:
+            if once:
+                break
+            _stop.wait(poll)
+            continue
+        print(f"🎬 Job {job['id']} (attempt {job['attempts']})")
+        run_job(job, worker, scratch_root)
+
+
+def _request_stop(signum, frame):
+    print("🛑 Stopping after the current job")
+    _stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--poll", type=float, default=WORKER_POLL_SECONDS, help="seconds between empty polls")
+    parser.add_argument("--scratch-dir", default=None, help="where jobs render (default: /dev/shm when it has room, else system temp)")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    run(once=args.once, poll=args.poll, scratch_root=args.scratch_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# === Per-job scratch directories ===
+#
+# Every intermediate file of a merge goes into the job's own workspace, so merges
+# can run side by side (threads or processes) without sharing file names.
+
+# Where workspaces are created. Defaults to /dev/shm (tmpfs, the intermediates never
+# touch the disk) when it has room, the system temp directory otherwise.
+WORKSPACE_ROOT = os.environ.get("MERGE_WORKSPACE_ROOT")
+# Free space tmpfs needs to be used by default, the intermediates of a long merge are large
+WORKSPACE_MIN_FREE_MB = int(os.environ.get("MERGE_WORKSPACE_MIN_FREE_MB", "1024"))
+
+_TMPFS = Path("/dev/shm")
+
+
+def default_root():
+    if WORKSPACE_ROOT:
+        return WORKSPACE_ROOT
+    try:
+        if os.access(_TMPFS, os.W_OK) and shutil.disk_usage(_TMPFS).free >= WORKSPACE_MIN_FREE_MB * 1024 ** 2:
+            return str(_TMPFS)
+    except OSError:
+        pass
+    return None
+
+
+@contextmanager
+def workspace(prefix="merge_", root=None):
+    """
+    A fresh directory for the intermediate files of one job, removed when the
+    block exits, whether the job succeeded or not.
+
+    :param root: Directory to create it in, default_root() when omitted.
+    """
+    path = Path(tempfile.mkdtemp(prefix=prefix, dir=root or default_root()))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,114 @@
+import math
+import threading
+
+# === Prometheus text exposition for /metrics ===
+#
+# Request-level histograms are kept in memory per API process. Merge job metrics
+# are computed from the shared job store on scrape, the workers are separate processes.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+MERGE_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 3600)
+THROUGHPUT_BUCKETS = tuple(256 * 1024 << power for power in range(13))  # 256 KiB/s to 1 GiB/s
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def histogram_lines(name, buckets, bucket_counts, total, count, labels=None):
+    """
+    Sample lines of one histogram series.
+
+    :param bucket_counts: Cumulative count of observations <= each bucket bound.
+    """
+    labels = labels or {}
+    lines = [
+        f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {bucket_count}"
+        for bound, bucket_count in zip(buckets, bucket_counts)
+    ]
+    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return lines
+
+
+def header_lines(name, help_text, metric_type):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        lines = header_lines(self.name, self.help_text, "histogram")
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                lines += histogram_lines(
+                    self.name, self.buckets, bucket_counts, total, count, dict(zip(self.label_names, key))
+                )
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def collect(self):
+        return header_lines(self.name, self.help_text, "counter") + [f"{self.name} {_format_value(self.value)}"]
+
+
+class Collector:
+    """
+    Metrics computed on scrape: collect_fn returns the sample lines, headers included.
+    """
+
+    def __init__(self, collect_fn):
+        self.collect = collect_fn
+        REGISTRY.append(self)
+
+
+REGISTRY = []
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.collect()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+# Orders live in SQLite (WAL) so they survive restarts and every API worker sees
+# the same queue
+ORDER_DB = os.environ.get("ORDER_DB", str(Path(__file__).resolve().parent / "order_queue.sqlite3"))
+# How long a claimed order stays invisible to other consumers before it is handed out again
+ORDER_LEASE_SECONDS = float(os.environ.get("ORDER_LEASE_SECONDS", "60"))
+# Claims after which an order whose lease keeps expiring is given up on
+ORDER_MAX_ATTEMPTS = int(os.environ.get("ORDER_MAX_ATTEMPTS", "5"))
+ORDER_MAX_BATCH = 100
+# Longest a consumer may block waiting for an order
+ORDER_MAX_WAIT = 60
+# Waiting consumers are woken right away by orders added in this process; orders
+# added by other API workers are picked up by re-checking this often
+ORDER_POLL_INTERVAL = float(os.environ.get("ORDER_POLL_INTERVAL", "0.5"))
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_id TEXT,
+    leased_until REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_status_id ON orders (status, id);
+"""
+
+_initialized = set()
+# (event loop, asyncio.Event) set when an order is enqueued, then replaced
+_wakeup = None
+
+
+class LeaseLost(Exception):
+    """
+    The order is not (or no longer) leased under the given lease id.
+    """
+
+
+def connect():
+    # Transactions are managed explicitly, claims need BEGIN IMMEDIATE
+    conn = sqlite3.connect(ORDER_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if ORDER_DB not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized.add(ORDER_DB)
+    return conn
+
+
+def _order(row, leased=False):
+    order = {"id": row["id"], **json.loads(row["payload"])}
+    if leased:
+        order["lease_id"] = row["lease_id"]
+        order["leased_until"] = row["leased_until"]
+        order["attempts"] = row["attempts"]
+    return order
+
+
+def enqueue(order):
+    """
+    Add an order (a JSON-serializable dict) to the end of the queue.
+
+    :return: The id of the order.
+    """
+    now = time.time()
+    conn = connect()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO orders (payload, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (json.dumps(order), QUEUED, now, now)
+        )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+        _notify()
+
+
+def _notify():
+    if _wakeup is not None:
+        loop, _ = _wakeup
+        try:
+            loop.call_soon_threadsafe(_wake)
+        except RuntimeError:
+            pass  # loop closed
+
+
+def _wake():
+    global _wakeup
+    loop, event = _wakeup
+    _wakeup = (loop, asyncio.Event())
+    event.set()
+
+
+def _wakeup_event():
+    global _wakeup
+    loop = asyncio.get_running_loop()
+    if _wakeup is None or _wakeup[0] is not loop:
+        _wakeup = (loop, asyncio.Event())
+    return _wakeup[1]
+
+
+async def wait_for(take, wait, cancelled=None):
+    """
+    Call take() (e.g. pop or a claim) until it returns orders or wait seconds have
+    passed. Every order still goes to exactly one consumer, waiters only race for
+    the claim.
+
+    :param cancelled: Optional coroutine function, checked before every take() so a
+        consumer that went away does not take orders.
+    :return: What take() returned last, None when cancelled.
+
+    take() runs in a thread: claims wait for SQLite's write lock (up to the busy
+    timeout), which must not hold up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(max(wait, 0), ORDER_MAX_WAIT)
+    while True:
+        # Taken before the claim, so an order enqueued in between still wakes us
+        event = _wakeup_event()
+        if cancelled is not None and await cancelled():
+            return None
+        result = await asyncio.to_thread(take)
+        remaining = deadline - loop.time()
+        if result or remaining <= 0:
+            return result
+        try:
+            await asyncio.wait_for(event.wait(), min(remaining, ORDER_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+
+
+def claim(n=1, lease_seconds=ORDER_LEASE_SECONDS):
+    """
+    Lease up to n of the oldest available orders. An order is available when it is
+    queued, or leased with an expired lease (its consumer died or gave up).
+
+    :return: The claimed orders, each with its id, lease_id, leased_until and attempts.
+    """
+    n = max(1, min(int(n), ORDER_MAX_BATCH))
+    now = time.time()
+    lease_id = uuid.uuid4().hex
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that were handed out too often are not retried forever
+            conn.execute(
+                "UPDATE orders SET status = ?, error = ?, lease_id = NULL, updated_at = ? "
+                "WHERE status = ? AND leased_until < ? AND attempts >= ?",
+                (FAILED, "lease expired too often", now, LEASED, now, ORDER_MAX_ATTEMPTS)
+            )
+            ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM orders WHERE status = ? OR (status = ? AND leased_until < ?) ORDER BY id LIMIT ?",
+                (QUEUED, LEASED, now, n)
+            )]
+            conn.executemany(
+                "UPDATE orders SET status = ?, lease_id = ?, leased_until = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                [(LEASED, lease_id, now + lease_seconds, now, order_id) for order_id in ids]
+            )
+            rows = conn.execute(
+                f"SELECT * FROM orders WHERE id IN ({','.join('?' * len(ids))}) ORDER BY id", ids
+            ).fetchall() if ids else []
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return [_order(row, leased=True) for row in rows]
+
+
+def _finish(order_id, lease_id, status, error=None):
+    conn = connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE orders SET status = ?, error = ?, lease_id = NULL, leased_until = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_id = ?",
+            (status, error, time.time(), order_id, LEASED, lease_id)
+        )
+        if cursor.rowcount == 0:
+            raise LeaseLost(f"Order {order_id} is not leased under {lease_id}.")
+    finally:
+        conn.close()
+
+
+def ack(order_id, lease_id):
+    """
+    Mark a leased order as done.
+    """
+    _finish(order_id, lease_id, DONE)
+
+
+def fail(order_id, lease_id, error=None, retry=True):
+    """
+    Give a leased order back: it is queued again when retry is set and it has
+    attempts left, otherwise it is marked failed.
+    """
+    order = get_order(order_id)
+    if order is None:
+        raise LeaseLost(f"Order {order_id} not found.")
+    if retry and order["attempts"] < ORDER_MAX_ATTEMPTS:
+        _finish(order_id, lease_id, QUEUED, error)
+    else:
+        _finish(order_id, lease_id, FAILED, error)
+
+
+def pop():
+    """
+    Claim and acknowledge the oldest order in one go, for consumers that do not ack.
+    """
+    orders = claim(1)
+    if not orders:
+        return None
+    order = orders[0]
+    ack(order["id"], order["lease_id"])
+    for key in ("lease_id", "leased_until", "attempts"):
+        del order[key]
+    return order
+
+
+def get_order(order_id):
+    conn = connect()
+    try:
+        row = conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {**_order(row, leased=True), "status": row["status"], "error": row["error"]}
+
+
+def stats():
+    conn = connect()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS count FROM orders GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    counts = {status: 0 for status in (QUEUED, LEASED, DONE, FAILED)}
+    counts.update({row["status"]: row["count"] for row in rows})
+    return counts
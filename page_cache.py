@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Rendered HTML pages, keyed by (page, query) and stamped with the version of the
+# data they were rendered from (the media index generation, the catalog, ...)
+PAGE_CACHE_ENTRIES = int(os.environ.get("PAGE_CACHE_ENTRIES", "256"))
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+_pages = OrderedDict()
+_lock = threading.Lock()
+
+
+class RenderedPage:
+    """
+    One rendered page with its ETag and precompressed bodies.
+    """
+
+    def __init__(self, html, version):
+        self.version = version
+        self.bodies = {"identity": html.encode("utf-8")}
+        digest = hashlib.sha256(self.bodies["identity"]).hexdigest()[:32]
+        if len(self.bodies["identity"]) >= COMPRESS_MIN_BYTES:
+            self.bodies["gzip"] = gzip.compress(self.bodies["identity"], compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(self.bodies["identity"])
+        # Strong ETags, one per representation
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _pick_encoding(page, accept_encoding):
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in page.bodies and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def get_page(key, version, render):
+    """
+    The cached page for key if it was rendered from this version of the data,
+    otherwise render() it (returns the HTML) and cache the result.
+    """
+    with _lock:
+        page = _pages.get(key)
+        if page is not None and page.version == version:
+            _pages.move_to_end(key)
+            return page
+
+    page = RenderedPage(render(), version)
+    with _lock:
+        _pages[key] = page
+        _pages.move_to_end(key)
+        while len(_pages) > PAGE_CACHE_ENTRIES:
+            _pages.popitem(last=False)
+    return page
+
+
+def cached_html(request, key, version, render):
+    """
+    HTML response for a cacheable page: answers If-None-Match with 304 and serves
+    a precompressed body when the client accepts one.
+
+    :param request: The incoming request.
+    :param key: Identifies the page, including whatever query parameters it depends on.
+    :param version: Anything that changes when the page would render differently.
+    :param render: Callable returning the HTML of the page.
+    """
+    page = get_page(key, version, render)
+    encoding = _pick_encoding(page, request.headers.get("accept-encoding"))
+    etag = page.etags[encoding]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",  # may be stored, but revalidated on every use
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=page.bodies[encoding], media_type="text/html; charset=utf-8", headers=headers)
+
+
+def clear():
+    with _lock:
+        _pages.clear()
@@ -0,0 +1,186 @@
+"""
+Build the resized character thumbnails used by the order form.
+
+Every sprite in extracted_sprites_contour/ gets a derivative per width and format,
+named after a hash of its content so it can be cached forever. manifest.json maps
+each sprite to its derivatives; sprites that did not change since the last build
+are skipped.
+
+    python -m thumbnails [--force]
+"""
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+SPRITE_DIR = Path(__file__).resolve().parent / "extracted_sprites_contour"
+THUMBNAIL_DIR = Path(os.environ.get("THUMBNAIL_DIR", Path(__file__).resolve().parent / "thumbnail_cache"))
+# The order form shows the sprites at 150x150, 300 covers 2x screens
+THUMBNAIL_WIDTHS = (150, 300)
+THUMBNAIL_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 6},
+    "png": {"format": "PNG", "optimize": True},
+}
+MEDIA_TYPES = {"webp": "image/webp", "png": "image/png"}
+
+_manifest = None
+_variant_names = frozenset()
+_version = None
+
+
+def _source_stamp(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _encode(image, width, fmt):
+    # Same center crop the page applies with object-fit: cover
+    resized = ImageOps.fit(image, (width, width), Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, **THUMBNAIL_FORMATS[fmt])
+    return buffer.getvalue()
+
+
+def _build_sprite(source, out_dir):
+    entry = {"source": _source_stamp(source)}
+    with Image.open(source) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for fmt in THUMBNAIL_FORMATS:
+            entry[fmt] = {}
+            for width in THUMBNAIL_WIDTHS:
+                data = _encode(image, width, fmt)
+                name = f"{source.stem}.{width}.{hashlib.sha256(data).hexdigest()[:16]}.{fmt}"
+                if not (out_dir / name).exists():
+                    temp_path = out_dir / f".{name}.{os.getpid()}"
+                    temp_path.write_bytes(data)
+                    os.replace(temp_path, out_dir / name)
+                entry[fmt][str(width)] = name
+    return entry
+
+
+def build_thumbnails(sprite_dir=SPRITE_DIR, out_dir=THUMBNAIL_DIR, force=False):
+    """
+    Write the derivatives of every sprite and the manifest.
+
+    :return: The manifest, {"sprites": {sprite name: {"source": stamp, fmt: {width: file name}}}}
+    """
+    sprite_dir, out_dir = Path(sprite_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    previous = {} if force else read_manifest(out_dir).get("sprites", {})
+
+    sprites = {}
+    changed = []
+    for source in sorted(sprite_dir.glob("*.png")):
+        entry = previous.get(source.name)
+        if entry is not None and entry["source"] == _source_stamp(source) and all(
+            (out_dir / name).exists() for fmt in THUMBNAIL_FORMATS for name in entry[fmt].values()
+        ):
+            sprites[source.name] = entry
+        else:
+            changed.append(source)
+
+    if changed:
+        # forkserver: this runs in the server's startup too, which has threads fork does not mix with
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context("forkserver")) as pool:
+            for source, entry in zip(changed, pool.map(_build_sprite, changed, [out_dir] * len(changed))):
+                sprites[source.name] = entry
+        print(f"🖼️ Built thumbnails of {len(changed)} sprites")
+
+    manifest = {"sprites": sprites}
+    temp_path = out_dir / f".manifest.json.{os.getpid()}"
+    temp_path.write_text(json.dumps(manifest, sort_keys=True))
+    os.replace(temp_path, out_dir / "manifest.json")
+
+    # Derivatives of removed or changed sprites
+    current = _file_names(manifest)
+    for path in out_dir.iterdir():
+        if path.is_file() and path.name != "manifest.json" and not path.name.startswith(".") \
+                and path.name not in current:
+            path.unlink()
+    return manifest
+
+
+def _file_names(manifest):
+    return frozenset(
+        name
+        for entry in manifest.get("sprites", {}).values()
+        for fmt in THUMBNAIL_FORMATS
+        for name in entry[fmt].values()
+    )
+
+
+def read_manifest(out_dir=THUMBNAIL_DIR):
+    try:
+        return json.loads((Path(out_dir) / "manifest.json").read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def is_stale(manifest, sprite_dir=SPRITE_DIR):
+    sprites = manifest.get("sprites", {})
+    on_disk = {path.name: path for path in Path(sprite_dir).glob("*.png")}
+    if set(on_disk) != set(sprites):
+        return True
+    return any(sprites[name]["source"] != _source_stamp(path) for name, path in on_disk.items())
+
+
+def load_manifest(build=True):
+    """
+    The current manifest, rebuilt first when sprites were added, changed or removed.
+    """
+    global _manifest, _variant_names, _version
+    manifest = read_manifest()
+    if build and is_stale(manifest):
+        manifest = build_thumbnails()
+    _manifest = manifest
+    _variant_names = _file_names(manifest)
+    _version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+    return manifest
+
+
+def manifest():
+    return _manifest if _manifest is not None else load_manifest()
+
+
+def manifest_version():
+    manifest()
+    return _version
+
+
+def variants(sprite_name):
+    """
+    {fmt: {width: file name}} for a sprite, None when it has no derivatives.
+    """
+    entry = manifest().get("sprites", {}).get(sprite_name)
+    if entry is None:
+        return None
+    return {fmt: {int(width): name for width, name in entry[fmt].items()} for fmt in THUMBNAIL_FORMATS}
+
+
+def variant_path(name):
+    """
+    Path of a derivative listed in the manifest, None for anything else.
+    """
+    manifest()
+    if name not in _variant_names:
+        return None
+    return THUMBNAIL_DIR / name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="rebuild every derivative")
+    args = parser.parse_args()
+
+    manifest = build_thumbnails(force=args.force)
+    print(f"✅ {len(manifest['sprites'])} sprites in {THUMBNAIL_DIR}")
+
+
+if __name__ == "__main__":
+    main()
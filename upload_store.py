@@ -0,0 +1,294 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Blobs and uploads in progress, outside the served upload directory so nothing
+# half-written can be downloaded. Keep it on the upload directory's filesystem,
+# the uploaded names are hard links into it.
+UPLOAD_STORE_DIR = Path(os.environ.get("UPLOAD_STORE_DIR", Path(__file__).resolve().parent / "upload_data"))
+# Uploaded content is stored once per SHA-256 under <store>/blobs/, the names the
+# videos were uploaded with are hard links to those blobs
+BLOB_DIR_NAME = "blobs"
+# Resumable uploads in progress live under <store>/partial/<upload id>/
+PARTIAL_DIR_NAME = "partial"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 2 * 1024 ** 3))
+# Resumable uploads without a written chunk for this long are removed
+UPLOAD_SESSION_TTL_SECONDS = float(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))
+# Resumable uploads that may be open at the same time
+MAX_UPLOAD_SESSIONS = int(os.environ.get("MAX_UPLOAD_SESSIONS", "100"))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class UploadIncomplete(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+class TooManyUploads(Exception):
+    pass
+
+
+async def store_upload(file, filename, upload_dir, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Stream an UploadFile to disk in fixed-size chunks, hashing it on the way.
+
+    :param file: The FastAPI UploadFile.
+    :param filename: Name the video is stored under in upload_dir.
+    :param upload_dir: Directory of the uploaded videos.
+    :param max_bytes: Largest accepted upload, UploadTooLarge is raised past it.
+    :return: dict with filename, sha256, size and whether the content was a duplicate.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    partial_dir = UPLOAD_STORE_DIR / PARTIAL_DIR_NAME
+    partial_dir.mkdir(parents=True, exist_ok=True)
+    temp = tempfile.NamedTemporaryFile(dir=partial_dir, prefix=".upload-", suffix=".part", delete=False)
+    try:
+        with temp:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes.")
+                digest.update(chunk)
+                temp.write(chunk)
+        os.chmod(temp.name, 0o644)  # NamedTemporaryFile creates it owner-only
+        return publish_blob(temp.name, digest.hexdigest(), size, filename, upload_dir)
+    except BaseException:
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+        raise
+
+
+def publish_blob(temp_path, sha256, size, filename, upload_dir):
+    """
+    Move a fully written upload into the blob store (or drop it if the same content
+    is already there) and atomically point upload_dir/filename at the blob.
+    """
+    blob_dir = UPLOAD_STORE_DIR / BLOB_DIR_NAME
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    blob_path = blob_dir / f"{sha256}{Path(filename).suffix.lower()}"
+
+    deduplicated = blob_path.exists()
+    if deduplicated:
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, blob_path)
+
+    link_path = Path(upload_dir) / f".link-{uuid.uuid4().hex}"
+    try:
+        os.link(blob_path, link_path)
+    except OSError:
+        # No hard links on this filesystem, fall back to a copy
+        shutil.copyfile(blob_path, link_path)
+    os.replace(link_path, Path(upload_dir) / filename)
+
+    return {
+        "filename": filename,
+        "sha256": sha256,
+        "size": size,
+        "deduplicated": deduplicated,
+    }
+
+
+# === Resumable uploads ===
+#
+# A session has a preallocated data file that chunks are written into at their
+# offset, so chunks may arrive in any order and in parallel. Every written byte
+# range is recorded as an empty file named <start>-<end> in ranges/, which needs
+# no locking between concurrent requests or workers.
+
+def _session_dir(upload_id):
+    session_dir = UPLOAD_STORE_DIR / PARTIAL_DIR_NAME / os.path.basename(upload_id)
+    if not (session_dir / "meta.json").exists():
+        raise UploadNotFound(f"Upload {upload_id} not found.")
+    return session_dir
+
+
+def create_session(filename, size, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Start a resumable upload of size bytes that will be stored as filename.
+
+    :param size: Byte count, as an int or a string of digits (e.g. a form field).
+    """
+    if isinstance(size, str) and size.strip().isdigit():
+        size = int(size)
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        raise InvalidUpload(f"Upload size must be a byte count, got {size!r}.")
+    if size > max_bytes:
+        raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes.")
+    sweep_sessions()
+    if open_session_count() >= MAX_UPLOAD_SESSIONS:
+        raise TooManyUploads(f"{MAX_UPLOAD_SESSIONS} uploads are already in progress, try again later.")
+
+    upload_id = uuid.uuid4().hex
+    session_dir = UPLOAD_STORE_DIR / PARTIAL_DIR_NAME / upload_id
+    (session_dir / "ranges").mkdir(parents=True)
+    with open(session_dir / "data", "wb") as f:
+        f.truncate(size)
+    (session_dir / "meta.json").write_text(json.dumps({
+        "filename": filename,
+        "size": size,
+        "created_at": time.time(),
+    }))
+    return session_status(upload_id)
+
+
+async def write_chunk(upload_id, offset, chunks):
+    """
+    Write a chunk of a resumable upload at offset.
+
+    :param chunks: Async iterator over the bytes of the chunk (e.g. Request.stream()),
+        written as they arrive. What was written is kept even if the request breaks off.
+    """
+    session_dir = _session_dir(upload_id)
+    size = json.loads((session_dir / "meta.json").read_text())["size"]
+    if offset < 0 or offset > size:
+        raise UploadTooLarge(f"Offset {offset} is outside the upload of {size} bytes.")
+
+    position = offset
+    fd = os.open(session_dir / "data", os.O_WRONLY)
+    try:
+        async for chunk in chunks:
+            if position + len(chunk) > size:
+                raise UploadTooLarge(f"Chunk runs past the end of the upload of {size} bytes.")
+            os.pwrite(fd, chunk, position)
+            position += len(chunk)
+    finally:
+        os.close(fd)
+        if position > offset:
+            (session_dir / "ranges" / f"{offset}-{position}").touch()
+
+    return session_status(upload_id)
+
+
+def _received_ranges(session_dir):
+    ranges = sorted(
+        tuple(int(part) for part in marker.name.split("-"))
+        for marker in (session_dir / "ranges").iterdir()
+    )
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def session_status(upload_id):
+    """
+    :return: dict with the size, the received byte ranges and offset, the number of
+        bytes received contiguously from the start (where a sequential client resumes).
+    """
+    session_dir = _session_dir(upload_id)
+    meta = json.loads((session_dir / "meta.json").read_text())
+    received = _received_ranges(session_dir)
+    offset = received[0][1] if received and received[0][0] == 0 else 0
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "offset": offset,
+        "received": received,
+        "complete": offset == meta["size"],
+    }
+
+
+def open_session_count():
+    partial_dir = UPLOAD_STORE_DIR / PARTIAL_DIR_NAME
+    if not partial_dir.exists():
+        return 0
+    return sum(1 for entry in partial_dir.iterdir() if entry.is_dir())
+
+
+def sweep_sessions(ttl_seconds=None):
+    """
+    Remove the resumable uploads (and leftover POST /upload temp files) nothing was
+    written to for ttl_seconds, UPLOAD_SESSION_TTL_SECONDS when omitted.
+
+    :return: The number of entries removed.
+    """
+    ttl_seconds = UPLOAD_SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    partial_dir = UPLOAD_STORE_DIR / PARTIAL_DIR_NAME
+    if not partial_dir.exists():
+        return 0
+    cutoff = time.time() - ttl_seconds
+    removed = 0
+    for entry in partial_dir.iterdir():
+        # Chunks are written into data, its mtime is the last activity of a session
+        target = entry / "data" if (entry / "data").exists() else entry
+        try:
+            if target.stat().st_mtime >= cutoff:
+                continue
+        except OSError:
+            continue  # finalized meanwhile
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def finalize_session(upload_dir, upload_id, expected_sha256=None):
+    """
+    Hash a completely received upload and publish it like a regular upload.
+
+    Reads the whole upload, call it off the event loop. Chunks arrive in any order
+    and from different requests, so the hash cannot be carried along as they are
+    written.
+    """
+    status = session_status(upload_id)
+    if not status["complete"]:
+        raise UploadIncomplete(f"Upload {upload_id} has {status['offset']} of {status['size']} bytes.")
+
+    session_dir = _session_dir(upload_id)
+    data_path = session_dir / "data"
+    digest = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        raise UploadIncomplete(f"Upload {upload_id} does not match the expected SHA-256.")
+
+    os.chmod(data_path, 0o644)
+    stored = publish_blob(data_path, sha256, status["size"], status["filename"], upload_dir)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return stored
+
+
+def move_legacy_store(upload_dir):
+    """
+    Move blobs/ and partial/ out of upload_dir, where older versions kept them, into
+    UPLOAD_STORE_DIR. The uploaded names stay hard links to the moved blobs.
+    """
+    for name in (BLOB_DIR_NAME, PARTIAL_DIR_NAME):
+        legacy_dir = Path(upload_dir) / name
+        if not legacy_dir.is_dir():
+            continue
+        target_dir = UPLOAD_STORE_DIR / name
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for entry in legacy_dir.iterdir():
+            if not (target_dir / entry.name).exists():
+                shutil.move(str(entry), str(target_dir / entry.name))
+        shutil.rmtree(legacy_dir, ignore_errors=True)